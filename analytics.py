@@ -0,0 +1,121 @@
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from storage import RATING_FIELDS, read_table, stage_path, write_table
+from profiling import PROFILER
+
+# Per-project summary of the pipeline output, computed in one pass over processed_reviews
+# and phrases instead of ad-hoc notebook reloads. One row per XID with, per aspect, the
+# mean rating, the number of rated reviews and the count of each score 1-5, plus the
+# most frequent positive and negative phrases. The table is written sorted by XID to
+# project_summary; load_summary() returns it indexed by XID for lookups.
+ASPECTS = RATING_FIELDS + ["overall_rating"]
+SCORES = range(1, 6)
+TOP_PHRASES = int(os.getenv("ANALYTICS_TOP_PHRASES", "10"))
+
+
+def rating_stats(reviews):
+    """Mean, count and 1-5 distribution of every aspect, per XID."""
+    ratings = reviews[["xid"] + [a for a in ASPECTS if a in reviews.columns]].copy()
+    aspects = [c for c in ratings.columns if c != "xid"]
+    # Plain floats, so a nullable Parquet rating compares to NaN rather than NA
+    ratings[aspects] = ratings[aspects].apply(pd.to_numeric, errors="coerce").astype(float)
+
+    grouped = ratings.groupby("xid")
+    stats = [grouped.size().rename("reviews")]
+    means = grouped[aspects].mean().round(2).add_suffix("_mean")
+    counts = grouped[aspects].count().add_suffix("_n")
+    stats += [means, counts]
+
+    # Distributions: one-hot the scores, half points rounded up, and sum them per XID
+    for aspect in aspects:
+        scores = np.floor(ratings[aspect] + 0.5)
+        onehot = pd.DataFrame({f"{aspect}_{s}": (scores == s).fillna(False).astype("int32") for s in SCORES})
+        stats.append(onehot.groupby(ratings["xid"]).sum())
+
+    if "duration_of_stay" in reviews.columns:
+        years = pd.to_numeric(reviews["duration_of_stay"].astype(str).str.extract(r"(\d+(?:\.\d+)?)")[0],
+                              errors="coerce")
+        stats.append(years.groupby(reviews["xid"]).mean().round(1).rename("duration_years_mean"))
+    return pd.concat(stats, axis=1)
+
+
+def phrase_stats(phrases, top=TOP_PHRASES):
+    """Phrase counts and the top phrases per sentiment, per XID."""
+    phrases = phrases[["xid", "Phrase", "Sentiment"]].dropna()
+    phrases = phrases.assign(
+        xid=phrases["xid"].astype(str),
+        Phrase=phrases["Phrase"].astype(str).str.strip().str.lower(),
+        Sentiment=phrases["Sentiment"].astype(str).str.strip().str.lower()
+    )
+    phrases = phrases[phrases["Sentiment"].isin(["positive", "negative"]) & (phrases["Phrase"] != "")]
+
+    counts = phrases.groupby(["xid", "Sentiment", "Phrase"]).size().rename("n").reset_index()
+    counts = counts.sort_values(["xid", "Sentiment", "n", "Phrase"], ascending=[True, True, False, True])
+    counts["label"] = counts["Phrase"] + " (" + counts["n"].astype(str) + ")"
+    top_phrases = (counts.groupby(["xid", "Sentiment"]).head(top)
+                   .groupby(["xid", "Sentiment"])["label"].agg("; ".join)
+                   .unstack())
+    totals = phrases.groupby(["xid", "Sentiment"]).size().unstack(fill_value=0)
+
+    stats = pd.DataFrame(index=totals.index)
+    for sentiment in ["positive", "negative"]:
+        stats[f"{sentiment}_phrases"] = totals[sentiment] if sentiment in totals else 0
+        stats[f"top_{sentiment}_phrases"] = top_phrases[sentiment] if sentiment in top_phrases else ""
+    return stats
+
+
+@PROFILER.profiled('analytics:build_summary')
+def build_summary(reviews_path=None, phrases_path=None):
+    reviews_path = reviews_path or stage_path("processed_reviews")
+    phrases_path = phrases_path or stage_path("phrases")
+
+    reviews = read_table(reviews_path)
+    reviews["xid"] = reviews["xid"].astype(str)
+    names = reviews.groupby("xid")["project_name"].first().to_frame()
+    parts = [rating_stats(reviews)]
+    if os.path.exists(phrases_path):
+        parts.append(phrase_stats(read_table(phrases_path)))
+    else:
+        print(f"{phrases_path} not found, summary has no phrase statistics")
+
+    summary = names.join(parts, how="left").sort_index()
+    summary.index.name = "xid"
+    # Projects without phrases get empty phrase lists and zero counts
+    for column in summary.columns:
+        if column.startswith("top_"):
+            summary[column] = summary[column].fillna("")
+        elif column == "reviews" or re.search(r"_(n|[1-5]|phrases)$", column):
+            summary[column] = summary[column].fillna(0).astype("int32")
+    return summary
+
+
+def write_summary(summary, path=None):
+    path = path or stage_path("project_summary")
+    write_table(summary.reset_index(), path, "project_summary")
+    return path
+
+
+def load_summary(path=None):
+    """The project summary indexed by XID."""
+    summary = read_table(path or stage_path("project_summary"), dtype={"xid": str})
+    # Empty phrase lists come back from CSV as NaN
+    top_columns = [c for c in summary.columns if c.startswith("top_")]
+    summary[top_columns] = summary[top_columns].fillna("")
+    return summary.set_index("xid").sort_index()
+
+
+if __name__ == "__main__":
+    # python analytics.py [xid ...] builds the summary and prints the given projects
+    summary = build_summary()
+    output_file = write_summary(summary)
+    print(f"Summarised {len(summary)} projects to {output_file}")
+    for xid in sys.argv[1:]:
+        if xid in summary.index:
+            print(summary.loc[xid].to_string())
+        else:
+            print(f"{xid}: not in summary")
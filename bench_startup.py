@@ -0,0 +1,65 @@
+"""
+Import-time benchmark for the pipeline modules.
+
+Each module is imported in a fresh interpreter several times and the median import time
+is reported. Modules listed in BUDGETS_MS must stay under their budget; the script exits
+non-zero when one does not, so it can gate changes that add eager imports.
+
+    python bench_startup.py [repeats]
+"""
+import os
+import sys
+import statistics
+import subprocess
+
+# Modules on the startup path of every CLI run must stay cheap to import
+BUDGETS_MS = {
+    'cli': 100,
+    'storage': 100,
+    'incremental': 100,
+    'job_queue': 100,
+    # Stage modules that can be imported without running their stage. sentiment and
+    # review_generation import pandas up front (about 0.5 s); their budget leaves room for
+    # it but not for an SDK such as google-genai or transformers loaded at import time.
+    'phrases_extraction': 150,
+    'sentiment': 1000,
+    'review_generation': 1000,
+}
+
+SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def import_time_ms(module, repeats):
+    samples = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", SNIPPET.format(module=module)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return None
+        samples.append(float(result.stdout.strip().splitlines()[-1]) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failed = False
+    for module, budget in BUDGETS_MS.items():
+        elapsed = import_time_ms(module, repeats)
+        if elapsed is None:
+            status = "import failed"
+            failed = True
+        elif elapsed > budget:
+            status = f"OVER BUDGET ({budget} ms)"
+            failed = True
+        else:
+            status = f"ok (budget {budget} ms)"
+        timing = "-" if elapsed is None else f"{elapsed:.1f} ms"
+        print(f"{module:<20} {timing:>12}  {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
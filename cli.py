@@ -0,0 +1,41 @@
+"""
+Lightweight entry point for the review pipeline.
+
+    python cli.py <stage> [stage arguments]
+
+Stages run in this order: sentiment, phrases, sets, generate, clean, analytics. Only
+the selected stage's module is imported, and the heavy SDKs are imported lazily inside
+the stages, so short incremental runs and restarted queue workers start quickly, e.g.
+
+    python cli.py sentiment --fused --incremental
+    python cli.py generate worker worker-1
+"""
+import sys
+import runpy
+
+STAGES = {
+    'sentiment': 'sentiment',
+    'phrases': 'phrases_extraction',
+    'sets': 'set_making',
+    'generate': 'review_generation',
+    'clean': 'clean',
+    'analytics': 'analytics',
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in STAGES:
+        print(__doc__.strip())
+        print(f"\nUnknown or missing stage. Choose one of: {', '.join(STAGES)}")
+        return 2
+
+    module = STAGES[argv[0]]
+    # Stages read their flags from sys.argv, so hand them the remaining arguments
+    sys.argv = [f"{module}.py"] + argv[1:]
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+from datetime import date
+
+# Token and spend accounting for every LLM call, aggregated per stage and per XID, with a
+# run-level budget shared by all stage processes through a small SQLite ledger. Each call
+# adds its tokens and cost to the ledger rows in one transaction, so concurrent workers
+# never overwrite each other's spend and check() always sees the spend of every process.
+#   LLM_BUDGET_USD          hard budget for the run; no further calls are made once it is used
+#   LLM_BUDGET_SOFT_RATIO   fraction of the budget after which the run degrades (default 0.8)
+#   LLM_DEGRADED_KEY_TYPE   cheaper /api/analyze keyType to switch to once degraded
+#   LLM_PRICES              JSON overriding PRICES, e.g. {"gemini-2.0-flash": [0.1, 0.4]}
+#   LLM_RUN_ID              ledger run id; defaults to today's date so each day is a new run
+#   LLM_COST_LEDGER         ledger path (default llm_costs.db)
+
+# USD per million (input, output) tokens
+PRICES = {
+    'gemini-2.0-flash': (0.10, 0.40),
+    'analyze:MINI': (0.15, 0.60),
+}
+DEFAULT_PRICE = (0.15, 0.60)
+CACHED_INPUT_DISCOUNT = 0.25  # cached context tokens are billed at a quarter of the input price
+CHARS_PER_TOKEN = 4
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def estimate_tokens(text):
+    return max(1, len(str(text)) // CHARS_PER_TOKEN) if text else 0
+
+
+class CostTracker:
+    def __init__(self, ledger_path='llm_costs.db', run_id=None, budget_usd=None, soft_ratio=0.8,
+                 degraded_key_type=None, prices=None):
+        """ledger_path is the shared SQLite file; None keeps the ledger in memory for this process."""
+        self.ledger_path = ledger_path
+        self.run_id = run_id or date.today().isoformat()
+        self.budget_usd = budget_usd
+        self.soft_ratio = soft_ratio
+        self.degraded_key_type = degraded_key_type
+        self.prices = dict(PRICES, **(prices or {}))
+        self.stage = None
+        self.xid = None
+        self._degraded_logged = False
+        self._conn = None
+
+    @property
+    def conn(self):
+        # Opened on first use so importing a stage does not create the ledger file
+        if self._conn is None:
+            # Autocommit mode with explicit BEGIN IMMEDIATE, as in job_queue
+            self._conn = sqlite3.connect(self.ledger_path or ':memory:', timeout=30, isolation_level=None)
+            if self.ledger_path:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_costs ("
+                " run_id TEXT NOT NULL, scope TEXT NOT NULL, name TEXT NOT NULL,"
+                " calls INTEGER NOT NULL DEFAULT 0, input_tokens INTEGER NOT NULL DEFAULT 0,"
+                " cached_tokens INTEGER NOT NULL DEFAULT 0, output_tokens INTEGER NOT NULL DEFAULT 0,"
+                " estimated_calls INTEGER NOT NULL DEFAULT 0, cost_usd REAL NOT NULL DEFAULT 0,"
+                " updated_at REAL, PRIMARY KEY (run_id, scope, name))"
+            )
+        return self._conn
+
+    @classmethod
+    def from_env(cls):
+        budget = os.getenv("LLM_BUDGET_USD")
+        prices = os.getenv("LLM_PRICES")
+        return cls(
+            ledger_path=os.getenv("LLM_COST_LEDGER", "llm_costs.db"),
+            run_id=os.getenv("LLM_RUN_ID"),
+            budget_usd=float(budget) if budget else None,
+            soft_ratio=float(os.getenv("LLM_BUDGET_SOFT_RATIO", "0.8")),
+            degraded_key_type=os.getenv("LLM_DEGRADED_KEY_TYPE") or None,
+            prices={k: tuple(v) for k, v in json.loads(prices).items()} if prices else None
+        )
+
+    @property
+    def ledger(self):
+        """The run's totals, per stage and per XID, as read from the shared ledger."""
+        ledger = {'run_id': self.run_id, 'total': self._bucket(), 'stages': {}, 'xids': {}}
+        rows = self.conn.execute(
+            "SELECT scope, name, calls, input_tokens, cached_tokens, output_tokens, estimated_calls, cost_usd"
+            " FROM llm_costs WHERE run_id = ? ORDER BY rowid", (self.run_id,)
+        ).fetchall()
+        for scope, name, *values in rows:
+            bucket = dict(zip(self._bucket(), values))
+            if scope == 'total':
+                ledger['total'] = bucket
+            else:
+                ledger[scope][name] = bucket
+        return ledger
+
+    @staticmethod
+    def _bucket():
+        return {'calls': 0, 'input_tokens': 0, 'cached_tokens': 0, 'output_tokens': 0,
+                'estimated_calls': 0, 'cost_usd': 0.0}
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def set_context(self, stage=None, xid=None):
+        """Attribute the following calls to a stage and XID."""
+        self.stage = stage
+        self.xid = None if xid is None else str(xid)
+
+    @property
+    def spent_usd(self):
+        row = self.conn.execute("SELECT cost_usd FROM llm_costs WHERE run_id = ? AND scope = 'total'",
+                                (self.run_id,)).fetchone()
+        return row[0] if row else 0.0
+
+    @property
+    def degraded(self):
+        """True once the soft limit is reached; stages then switch to cheaper modes."""
+        is_degraded = self.budget_usd is not None and self.spent_usd >= self.budget_usd * self.soft_ratio
+        if is_degraded and not self._degraded_logged:
+            self._degraded_logged = True
+            print(f"LLM spend ${self.spent_usd:.4f} reached {self.soft_ratio:.0%} of the "
+                  f"${self.budget_usd:.2f} budget, degrading to cheaper modes")
+        return is_degraded
+
+    def check(self):
+        """Raise BudgetExceeded before a call once the run's budget is used up."""
+        if self.budget_usd is not None and self.spent_usd >= self.budget_usd:
+            raise BudgetExceeded(f"LLM budget of ${self.budget_usd:.2f} used (${self.spent_usd:.4f} spent)")
+
+    def record(self, model, input_tokens, output_tokens, cached_tokens=0, estimated=False):
+        price_in, price_out = self.prices.get(model, DEFAULT_PRICE)
+        billed_input = input_tokens - cached_tokens + cached_tokens * CACHED_INPUT_DISCOUNT
+        cost = (billed_input * price_in + output_tokens * price_out) / 1_000_000
+
+        scopes = [('total', ''), ('stages', self.stage or 'unknown')]
+        if self.xid is not None:
+            scopes.append(('xids', self.xid))
+        now = time.time()
+        # Add this call's deltas in place so concurrent processes accumulate rather than overwrite
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for scope, name in scopes:
+                self.conn.execute(
+                    "INSERT INTO llm_costs (run_id, scope, name, calls, input_tokens, cached_tokens,"
+                    " output_tokens, estimated_calls, cost_usd, updated_at) VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (run_id, scope, name) DO UPDATE SET calls = calls + 1,"
+                    " input_tokens = input_tokens + excluded.input_tokens,"
+                    " cached_tokens = cached_tokens + excluded.cached_tokens,"
+                    " output_tokens = output_tokens + excluded.output_tokens,"
+                    " estimated_calls = estimated_calls + excluded.estimated_calls,"
+                    " cost_usd = cost_usd + excluded.cost_usd, updated_at = excluded.updated_at",
+                    (self.run_id, scope, name, input_tokens, cached_tokens, output_tokens, int(estimated), cost, now)
+                )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return cost
+
+    def record_analyze(self, payload, response_data):
+        """Account an /api/analyze call from its usage block, or estimate from the text."""
+        model = f"analyze:{payload.get('keyType', 'MINI')}"
+        usage = response_data.get('usage') if isinstance(response_data, dict) else None
+        if isinstance(usage, dict) and 'prompt_tokens' in usage:
+            return self.record(model, usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0))
+        prompt_text = " ".join(str(m.get('content', '')) for m in payload.get('messages', []))
+        result_text = response_data.get('result', '') if isinstance(response_data, dict) else ''
+        return self.record(model, estimate_tokens(prompt_text), estimate_tokens(result_text), estimated=True)
+
+    def record_gemini(self, model, response, prompt_text):
+        """Account a Gemini call from usage_metadata, or estimate from the text."""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None and getattr(usage, 'prompt_token_count', None) is not None:
+            return self.record(model, usage.prompt_token_count or 0, usage.candidates_token_count or 0,
+                               cached_tokens=getattr(usage, 'cached_content_token_count', None) or 0)
+        return self.record(model, estimate_tokens(prompt_text), estimate_tokens(getattr(response, 'text', '')),
+                           estimated=True)
+
+    def summary(self):
+        ledger = self.ledger
+        total = ledger['total']
+        lines = [f"LLM usage for run {self.run_id}: {total['calls']} calls, {total['input_tokens']} input / "
+                 f"{total['output_tokens']} output tokens, ${total['cost_usd']:.4f}"
+                 + (f" of ${self.budget_usd:.2f} budget" if self.budget_usd is not None else "")]
+        for stage, bucket in ledger['stages'].items():
+            lines.append(f"  {stage}: {bucket['calls']} calls, ${bucket['cost_usd']:.4f}")
+        return "\n".join(lines)
+
+
+COSTS = CostTracker.from_env()
+atexit.register(COSTS.close)
@@ -0,0 +1,104 @@
+import os
+import json
+import shutil
+import hashlib
+
+from storage import append_table, is_parquet, phrase_list, read_table
+
+# Manifest of what previous runs already processed, used by the --incremental mode of
+# every stage so a weekly refresh only pays for new or changed reviews:
+#   reviews   - {xid: {review_hash: sentiment}} classified by sentiment.py
+#   phrased   - [review_hash, ...] already sent to phrase extraction
+#   pools     - {xid: hash of the phrase pool} behind the sets in output_sets
+#   generated - {xid: hash of the sets} behind the reviews in structured_reviews
+#   fresh     - {xid: time a new or changed review was last classified}, for scheduling
+MANIFEST_FILE = 'processed_manifest.json'
+
+
+def load_manifest(path=MANIFEST_FILE):
+    manifest = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    manifest.setdefault('reviews', {})
+    manifest.setdefault('phrased', [])
+    manifest.setdefault('pools', {})
+    manifest.setdefault('generated', {})
+    manifest.setdefault('fresh', {})
+    return manifest
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    # Write to a temporary file first so an interrupted run never leaves a torn manifest
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def get_xid(row):
+    return str(row.get('xid', row.get('XID')))
+
+
+def _digest(*parts):
+    return hashlib.sha1('\x1f'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def review_hash(row):
+    """Hash identifying a review by its project, stay duration and text."""
+    return _digest(get_xid(row), row.get('Project name'), row.get('How Long do you stay here'),
+                   str(row.get('Review')).strip())
+
+
+def pool_hash(positives, negatives, durations):
+    """Order-independent hash of a project's phrase pool."""
+    return _digest(sorted(positives), sorted(negatives), sorted(durations.items()))
+
+
+def sets_hash(row, columns):
+    """Hash of the sets (and their durations) generated reviews were produced from."""
+    values = []
+    for col in columns:
+        value = row.get(col)
+        # Sets are hashed as their joined phrases whether stored as a string or a list
+        phrases = phrase_list(value) if col.startswith("Set ") else None
+        values.append('; '.join(phrases) if phrases else value)
+    return _digest(*values)
+
+
+def read_previous(path):
+    """Previous stage output, or an empty frame when the stage has not run yet."""
+    import pandas as pd
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    try:
+        return read_table(path)
+    except Exception as e:
+        print(f"Could not read previous output {path}, reprocessing everything: {e}")
+        return pd.DataFrame()
+
+
+def drop_xids(path, xids, stage=None):
+    """Remove the rows of the given XIDs from an appended stage table."""
+    if not xids or not os.path.exists(path):
+        return
+    df = read_table(path)
+    xid_column = 'xid' if 'xid' in df.columns else 'XID'
+    kept = df[~df[xid_column].astype(str).isin(xids)]
+    if is_parquet(path):
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        if len(kept):
+            append_table(kept, path, stage)
+    else:
+        kept.to_csv(path, index=False)
+
+
+def previous_rows(path, hashes):
+    """Rows of a previous stage output whose review is still part of the current input."""
+    df = read_previous(path)
+    if 'review_hash' not in df.columns:
+        return []
+    return df[df['review_hash'].isin(hashes)].to_dict('records')
@@ -0,0 +1,163 @@
+import json
+import sqlite3
+import time
+
+# Durable queue of (xid, set_number) review generation jobs backed by a local SQLite file.
+# A job moves pending -> leased -> done, or back to pending on failure until it has used
+# max_attempts, after which it is dead-lettered. Leases expire so a job held by a crashed
+# worker is picked up again by another one. Pending jobs are leased highest priority first,
+# then in the order they were enqueued. Results and failures are only accepted from the
+# worker currently holding the lease, so a worker whose lease expired cannot overwrite
+# the job after another worker took it over.
+PENDING, LEASED, DONE, DEAD = 'pending', 'leased', 'done', 'dead'
+
+
+class JobQueue:
+    def __init__(self, path='review_jobs.db', lease_seconds=300, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Autocommit mode; multi-statement updates use explicit BEGIN IMMEDIATE so that
+        # several worker processes can share the file safely.
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                xid TEXT NOT NULL,
+                set_number INTEGER NOT NULL,
+                project_name TEXT,
+                phrases TEXT,
+                duration TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                worker TEXT,
+                result TEXT,
+                last_error TEXT,
+                updated_at REAL,
+                priority REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (xid, set_number)
+            )
+        """)
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if 'priority' not in columns:  # queue files created before priorities existed
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN priority REAL NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until)")
+
+    def enqueue(self, xid, project_name, set_number, phrases, duration, priority=0.0):
+        """
+        Add a job unless it is already queued. Returns True when a new job was added; for a
+        job that is still pending only its priority is updated.
+        """
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO jobs (xid, set_number, project_name, phrases, duration, updated_at, priority) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (str(xid), int(set_number), project_name, json.dumps(phrases), str(duration), time.time(), priority)
+        )
+        if cursor.rowcount > 0:
+            return True
+        self.conn.execute(
+            "UPDATE jobs SET priority = ? WHERE xid = ? AND set_number = ? AND state = ?",
+            (priority, str(xid), int(set_number), PENDING)
+        )
+        return False
+
+    def lease(self, worker, only=None):
+        """
+        Claim the next pending job, or a leased job whose lease expired, for a worker.
+        only restricts the claim to the given (xid, set_number) keys.
+        """
+        if only is not None and not only:
+            return None
+        now = time.time()
+        query = "SELECT * FROM jobs WHERE (state = ? OR (state = ? AND lease_until < ?))"
+        params = [PENDING, LEASED, now]
+        if only is not None:
+            query += " AND (xid, set_number) IN (VALUES " + ", ".join(["(?, ?)"] * len(only)) + ")"
+            params += [value for xid, set_number in only for value in (str(xid), int(set_number))]
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(query + " ORDER BY priority DESC, rowid LIMIT 1", params).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, lease_until = ?, worker = ?, updated_at = ? "
+                "WHERE xid = ? AND set_number = ?",
+                (LEASED, now + self.lease_seconds, worker, now, row['xid'], row['set_number'])
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job['phrases'] = json.loads(job['phrases'])
+        job['attempts'] += 1
+        return job
+
+    def complete(self, xid, set_number, worker, result):
+        """Store a job's result. Returns False when the worker no longer holds the lease."""
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = ?, result = ?, lease_until = NULL, last_error = NULL, updated_at = ? "
+            "WHERE xid = ? AND set_number = ? AND worker = ? AND state = ?",
+            (DONE, result, time.time(), str(xid), int(set_number), worker, LEASED)
+        )
+        return cursor.rowcount > 0
+
+    def fail(self, xid, set_number, worker, error):
+        """
+        Record a failed attempt; the job is dead-lettered once it has used max_attempts.
+        Returns False when the worker no longer holds the lease.
+        """
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "last_error = ?, lease_until = NULL, updated_at = ? "
+            "WHERE xid = ? AND set_number = ? AND worker = ? AND state = ?",
+            (self.max_attempts, DEAD, PENDING, str(error)[:500], time.time(), str(xid), int(set_number),
+             worker, LEASED)
+        )
+        return cursor.rowcount > 0
+
+    def release(self, xid, set_number, worker):
+        """
+        Hand a leased job back without counting the attempt, e.g. when the daily quota runs
+        out. Returns False when the worker no longer holds the lease.
+        """
+        cursor = self.conn.execute(
+            "UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), lease_until = NULL, updated_at = ? "
+            "WHERE xid = ? AND set_number = ? AND worker = ? AND state = ?",
+            (PENDING, time.time(), str(xid), int(set_number), worker, LEASED)
+        )
+        return cursor.rowcount > 0
+
+    def retry_dead(self):
+        """
+        Move every dead-lettered job back to pending with a fresh attempt budget. Returns the
+        (xid, set_number) keys of the requeued jobs.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [(row['xid'], row['set_number'])
+                    for row in self.conn.execute("SELECT xid, set_number FROM jobs WHERE state = ?", (DEAD,))]
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, last_error = NULL, updated_at = ? WHERE state = ?",
+                (PENDING, time.time(), DEAD)
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return keys
+
+    def counts(self):
+        rows = self.conn.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+        return {row['state']: row['n'] for row in rows}
+
+    def jobs(self):
+        """All jobs in the order they were enqueued."""
+        for row in self.conn.execute("SELECT * FROM jobs ORDER BY rowid"):
+            yield dict(row)
+
+    def close(self):
+        self.conn.close()
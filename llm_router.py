@@ -0,0 +1,446 @@
+import os
+import re
+import json
+import time
+import socket
+from urllib.parse import urlparse
+
+from llm_traffic import ANALYZE_API_URL, TRAFFIC, ReplayMiss, TextResponse, generate_content, post_analyze
+from cost_tracker import BudgetExceeded
+from rate_limit import DailyLimitReached, RateLimiter
+from profiling import PROFILER
+import progress
+
+# Routing of LLM tasks over interchangeable backends, so a stage keeps going when one
+# service is down and cheap tasks can be served by local inference.
+#   analyze  the internal /api/analyze service (keyType MINI)
+#   gemini   Gemini generate_content (GEMINI_API_KEY); shares its circuit with the review chats
+#            and its GEMINI_RATE_LIMIT_DB quota with review_generation
+#   local    a local CPU text classifier for sentiment, used when LOCAL_SENTIMENT_MODEL names a
+#            transformers model; it defers to the next backend below LOCAL_SENTIMENT_MIN_CONFIDENCE
+#   lexicon  keyword-based sentiment for outages; opt-in through LLM_ROUTES, and its results
+#            are stopgaps that incremental runs classify again
+#   mock     canned responses for dry runs and tests, never part of the default routes
+# Each task is tried on the backends of its route in order. A transient error (network,
+# 429, 5xx) is retried LLM_BACKEND_RETRIES times with exponential backoff starting at
+# LLM_BACKEND_BACKOFF_SECONDS before the next backend is tried. A backend failing
+# LLM_BREAKER_FAILURES times in a row is skipped for LLM_BREAKER_RESET_SECONDS, after
+# which a health check decides whether it gets traffic again. LLM_ROUTES overrides the
+# routes as JSON, e.g. {"sentiment": ["local", "analyze", "lexicon"]}. A "*" entry replaces
+# all default routes, so {"*": ["mock"]} is a dry run over the mock backend; task entries
+# given alongside it still take precedence.
+ROUTES = {
+    'sentiment': ['local', 'analyze', 'gemini'],
+    'fused': ['analyze', 'gemini'],
+    'phrases': ['analyze', 'gemini'],
+    # Review generation runs in Gemini chats; this route is its fallback while Gemini is down
+    'generation': ['analyze'],
+}
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class BackendError(Exception):
+    def __init__(self, message, transient=True):
+        super().__init__(message)
+        self.transient = transient
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=3, reset_seconds=60):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def is_open(self):
+        return self.state == OPEN and time.time() - self.opened_at < self.reset_seconds
+
+    def allow(self):
+        """True when a request may be sent; an open circuit past its reset time is half-opened."""
+        if self.state == OPEN:
+            if self.is_open():
+                return False
+            self.state = HALF_OPEN
+        return True
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.time()
+
+
+def _review_text(messages):
+    """The review from the last user message of a classification prompt."""
+    text = messages[-1]['content'] if messages else ''
+    match = re.match(r'\s*Review:\s*"(.*)"\s*$', text, re.S)
+    return match.group(1) if match else text
+
+
+class AnalyzeBackend:
+    name = 'analyze'
+    tasks = None  # any task
+    stopgap = False  # True for backends whose answers should be redone once the others recover
+
+    def __init__(self, url=ANALYZE_API_URL, key_type='MINI', timeout=30):
+        self.url = url
+        self.key_type = key_type
+        self.timeout = timeout
+
+    def available(self):
+        return True
+
+    def health_check(self):
+        """Cheap reachability probe: open a TCP connection to the service, no tokens spent."""
+        if TRAFFIC.mode == 'replay':
+            return True
+        parsed = urlparse(self.url)
+        try:
+            with socket.create_connection((parsed.hostname, parsed.port or 80), timeout=2):
+                return True
+        except OSError:
+            return False
+
+    def complete(self, task, messages, temperature):
+        payload = {"messages": messages, "temperature": temperature, "keyType": self.key_type}
+        response = post_analyze(payload, self.url, timeout=self.timeout)
+        if response.status_code != 200:
+            raise BackendError(f"/api/analyze returned status {response.status_code}",
+                               transient=response.status_code == 429 or response.status_code >= 500)
+        return response.json().get("result", "")
+
+
+class GeminiBackend:
+    name = 'gemini'
+    tasks = None
+    stopgap = False
+
+    def __init__(self, model='gemini-2.0-flash', rate_limit_path=None):
+        self.model = model
+        self.rate_limit_path = rate_limit_path
+        self._client = None
+        self._rate_limiter = None
+
+    def available(self):
+        return TRAFFIC.mode == 'replay' or bool(os.getenv("GEMINI_API_KEY"))
+
+    def client(self):
+        if self._client is None and TRAFFIC.mode != 'replay':
+            from google import genai
+            self._client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        return self._client
+
+    def health_check(self):
+        if TRAFFIC.mode == 'replay':
+            return True
+        try:
+            self.client().models.get(model=self.model)
+            return True
+        except Exception:
+            return False
+
+    def rate_limiter(self):
+        # Opened on first use so importing the router does not create the limiter file
+        if self._rate_limiter is None:
+            self._rate_limiter = RateLimiter(path=self.rate_limit_path)
+        return self._rate_limiter
+
+    def complete(self, task, messages, temperature):
+        if TRAFFIC.mode != 'replay':
+            try:
+                self.rate_limiter().acquire()
+            except DailyLimitReached as e:
+                raise BackendError(str(e), transient=False)
+        system = "\n".join(m['content'] for m in messages if m['role'] == 'system')
+        contents = [
+            {'role': 'model' if m['role'] == 'assistant' else 'user', 'parts': [{'text': m['content']}]}
+            for m in messages if m['role'] != 'system'
+        ]
+        config = None
+        if TRAFFIC.mode != 'replay':
+            from google.genai import types
+            config = types.GenerateContentConfig(system_instruction=system or None, temperature=temperature)
+        response = generate_content(self.client(), self.model, contents, config, f"router:{task}")
+        if not response.text:
+            raise BackendError("Empty response from Gemini")
+        return response.text
+
+
+class LocalSentimentBackend:
+    """
+    Sentiment classification with a local transformers model on the CPU. Only confident
+    positive/negative predictions are returned; anything else, including reviews that
+    should be ignored, returns None so the router defers it to the next backend.
+    """
+    name = 'local'
+    tasks = {'sentiment'}
+    stopgap = False
+
+    def __init__(self, model_name=None, min_confidence=0.9):
+        self.model_name = model_name
+        self.min_confidence = min_confidence
+        self._pipeline = None
+        self._load_failed = False
+
+    def available(self):
+        if not self.model_name or self._load_failed:
+            return False
+        if self._pipeline is None:
+            try:
+                from transformers import pipeline
+                self._pipeline = pipeline("text-classification", model=self.model_name, device=-1)
+            except Exception as e:
+                print(f"Local sentiment model {self.model_name} unavailable: {e}")
+                self._load_failed = True
+                return False
+        return True
+
+    def health_check(self):
+        return self.available()
+
+    def complete(self, task, messages, temperature):
+        prediction = self._pipeline(_review_text(messages), truncation=True)[0]
+        label = prediction['label'].lower()
+        if prediction['score'] < self.min_confidence or label not in {'positive', 'negative'}:
+            return None
+        return label
+
+
+class LexiconBackend:
+    """Keyword count sentiment; reviews without a clear majority are classified 'ignore'."""
+    name = 'lexicon'
+    tasks = {'sentiment'}
+    stopgap = True
+
+    POSITIVE = {
+        'good', 'great', 'excellent', 'spacious', 'clean', 'peaceful', 'green', 'well', 'maintained',
+        'safe', 'secure', 'convenient', 'nice', 'best', 'beautiful', 'quiet', 'amazing', 'happy'
+    }
+    NEGATIVE = {
+        'bad', 'poor', 'worst', 'leak', 'leakage', 'leaking', 'dirty', 'noisy', 'broken', 'crack',
+        'cracks', 'seepage', 'unsafe', 'cramped', 'flood', 'floods', 'problem', 'problems', 'issue', 'issues'
+    }
+
+    def available(self):
+        return True
+
+    def health_check(self):
+        return True
+
+    def complete(self, task, messages, temperature):
+        words = re.findall(r"[a-z]+", _review_text(messages).lower())
+        positive = sum(word in self.POSITIVE for word in words)
+        negative = sum(word in self.NEGATIVE for word in words)
+        if positive >= 2 * max(negative, 1):
+            return 'positive'
+        if negative >= 2 * max(positive, 1):
+            return 'negative'
+        return 'ignore'
+
+
+class MockBackend:
+    """Canned responses per task, or a responder(task, messages) callable, for tests."""
+    name = 'mock'
+    tasks = None
+    stopgap = False
+
+    RESPONSES = {
+        'sentiment': 'positive',
+        'phrases': '"well-maintained garden" (positive)',
+        'fused': '{"sentiment": "positive", "phrases": [{"phrase": "well-maintained garden", "sentiment": "positive"}]}',
+        'generation': json.dumps({
+            "positive_review": "The garden is well maintained.", "negative_review": "",
+            "society_management": "4", "green_area": "5", "amenities": "4", "connectivity": "NA",
+            "construction": "NA", "overall": "4", "duration_of_stay": "NA"
+        }),
+    }
+
+    def __init__(self, responder=None):
+        self.responder = responder
+        self.calls = []
+
+    def available(self):
+        return True
+
+    def health_check(self):
+        return True
+
+    def complete(self, task, messages, temperature):
+        self.calls.append((task, messages))
+        if self.responder is not None:
+            return self.responder(task, messages)
+        return self.RESPONSES.get(task, '')
+
+
+class LLMRouter:
+    def __init__(self, backends, routes=None, failure_threshold=3, reset_seconds=60, retries=2,
+                 backoff_seconds=1.0):
+        self.backends = {backend.name: backend for backend in backends}
+        routes = routes or {}
+        self.routes = dict({} if '*' in routes else ROUTES, **routes)
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.breakers = {name: CircuitBreaker(failure_threshold, reset_seconds) for name in self.backends}
+        self.stats = {name: {'served': 0, 'failed': 0, 'deferred': 0} for name in self.backends}
+
+    @classmethod
+    def from_env(cls):
+        routes = os.getenv("LLM_ROUTES")
+        return cls(
+            [
+                AnalyzeBackend(),
+                GeminiBackend(os.getenv("GEMINI_MODEL", "gemini-2.0-flash"),
+                              os.getenv("GEMINI_RATE_LIMIT_DB", "gemini_rate_limit.db")),
+                LocalSentimentBackend(os.getenv("LOCAL_SENTIMENT_MODEL") or None,
+                                      float(os.getenv("LOCAL_SENTIMENT_MIN_CONFIDENCE", "0.9"))),
+                LexiconBackend(),
+                MockBackend(),
+            ],
+            routes=json.loads(routes) if routes else None,
+            failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "3")),
+            reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "60")),
+            retries=int(os.getenv("LLM_BACKEND_RETRIES", "2")),
+            backoff_seconds=float(os.getenv("LLM_BACKEND_BACKOFF_SECONDS", "1"))
+        )
+
+    def route(self, task):
+        return self.routes.get(task) or self.routes.get('*') or []
+
+    def is_open(self, name):
+        return name in self.breakers and self.breakers[name].is_open()
+
+    def record_success(self, name):
+        self.breakers[name].record_success()
+
+    def record_failure(self, name):
+        self.breakers[name].record_failure()
+        self.stats[name]['failed'] += 1
+
+    def is_stopgap(self, name):
+        return getattr(self.backends.get(name), 'stopgap', False)
+
+    def _call(self, name, task, messages, temperature):
+        """One backend's answer, retrying transient errors with exponential backoff."""
+        backend = self.backends[name]
+        for attempt in range(self.retries + 1):
+            # Network backends register their call; the parse time of local answers stays unattributed
+            PROFILER.clear_call()
+            try:
+                with PROFILER.span(f"backend:{name}"):
+                    return backend.complete(task, messages, temperature)
+            except (BudgetExceeded, ReplayMiss):
+                raise
+            except Exception as e:
+                if attempt >= self.retries or not getattr(e, 'transient', True):
+                    raise
+                if TRAFFIC.mode != 'replay':
+                    progress.sleep(self.backoff_seconds * 2 ** attempt, 'backoff')
+
+    def complete(self, task, messages, temperature=0.8):
+        """
+        Send a chat-style prompt to the first healthy backend of the task's route and
+        return the response text. Raises NoBackendAvailable when every backend failed.
+        """
+        return self.complete_with_backend(task, messages, temperature)[0]
+
+    def complete_with_backend(self, task, messages, temperature=0.8):
+        """
+        complete() that also returns the name of the backend which answered. On replay, a
+        backend without a recording for the request is passed over like a failing one, and
+        ReplayMiss is raised only when no backend of the route answered.
+        """
+        errors = []
+        missed = False
+        for name in self.route(task):
+            if name not in self.backends:
+                errors.append(f"{name}: unknown backend")
+                continue
+            backend = self.backends[name]
+            breaker = self.breakers[name]
+            if backend.tasks is not None and task not in backend.tasks:
+                continue
+            if not backend.available():
+                errors.append(f"{name}: not configured")
+                continue
+            if not breaker.allow():
+                errors.append(f"{name}: circuit open")
+                continue
+            if breaker.state == HALF_OPEN and not backend.health_check():
+                self.record_failure(name)
+                errors.append(f"{name}: health check failed")
+                continue
+            try:
+                text = self._call(name, task, messages, temperature)
+            except BudgetExceeded:
+                raise
+            except ReplayMiss as e:
+                # The recorded run was served by another backend of the route
+                missed = True
+                errors.append(f"{name}: {e}")
+                continue
+            except Exception as e:
+                self.record_failure(name)
+                errors.append(f"{name}: {e}")
+                continue
+            breaker.record_success()
+            if text is None:
+                self.stats[name]['deferred'] += 1
+                continue
+            self.stats[name]['served'] += 1
+            return text, name
+        if missed:
+            raise ReplayMiss(f"No recorded response could serve '{task}': {'; '.join(errors)}")
+        raise NoBackendAvailable(f"No backend could serve '{task}': {'; '.join(errors) or 'empty route'}")
+
+    def health(self):
+        return {
+            name: {'available': backend.available(), 'healthy': backend.available() and backend.health_check(),
+                   'circuit': self.breakers[name].state}
+            for name, backend in self.backends.items()
+        }
+
+
+class RoutedChat:
+    """
+    Chat over the router for backends without chat sessions: the system instruction and
+    the whole conversation so far are sent with every message. Used in place of a Gemini
+    chat while Gemini is unavailable. Backends without structured output are held to
+    response_schema, a JSON schema, through the system instruction.
+    """
+
+    def __init__(self, router, task, system_instruction, temperature=0.8, response_schema=None):
+        self.router = router
+        self.task = task
+        self.temperature = temperature
+        if response_schema is not None:
+            system_instruction = (f"{system_instruction}\n\nRespond only with a JSON object matching this "
+                                  f"JSON schema:\n{json.dumps(response_schema)}")
+        self.messages = [{"role": "system", "content": system_instruction}]
+
+    def send_message(self, message):
+        self.messages.append({"role": "user", "content": message})
+        text = self.router.complete(self.task, self.messages, self.temperature)
+        self.messages.append({"role": "assistant", "content": text})
+        return TextResponse(text)
+
+    def get_history(self):
+        return self.messages[1:]
+
+
+ROUTER = LLMRouter.from_env()
+
+
+if __name__ == "__main__":
+    for name, status in ROUTER.health().items():
+        print(f"{name:8} available={status['available']} healthy={status['healthy']} circuit={status['circuit']}")
+    for task in sorted(set(ROUTES) | set(ROUTER.routes) - {'*'}):
+        print(f"{task}: {' -> '.join(ROUTER.route(task))}")
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import hashlib
+from contextlib import contextmanager
+
+from cost_tracker import COSTS
+from progress import track_wait
+from profiling import PROFILER
+
+# Record / replay of every LLM call made by the pipeline, so downstream stages can be
+# re-run and benchmarked offline against realistic responses.
+#   LLM_TRAFFIC_MODE=record  call the APIs and append each request/response pair to the log
+#   LLM_TRAFFIC_MODE=replay  serve responses from the log, never touching the network
+#   LLM_TRAFFIC_LOG          path of the append-only JSONL log (default llm_traffic.jsonl)
+# The log holds two kinds of lines. Call lines {key, kind, ts, request, response} store
+# every string of at least PROMPT_MIN_CHARS characters in the request (system prompts,
+# persona preambles) as {"$prompt": hash}; the text itself is written once, on a
+# {prompt, text} line ahead of its first use. Keys are computed over the full request.
+# A call that raises is recorded with an {error} response and raises ReplayedError when
+# replayed, so a run that fell back to another backend replays the same fallback.
+ANALYZE_API_URL = 'http://new99acresposting:6009/api/analyze'
+PROMPT_MIN_CHARS = 200
+
+
+class ReplayMiss(Exception):
+    pass
+
+
+class ReplayedError(Exception):
+    """A call that failed when it was recorded, failing again on replay."""
+
+
+class TrafficLog:
+    def __init__(self, mode='off', path='llm_traffic.jsonl'):
+        self.mode = mode
+        self.path = path
+        self.responses = None  # request key -> list of recorded responses, loaded on first replay
+        self.served = {}  # request key -> number of responses served so far
+        self.prompts = None  # hashes of the prompt texts already in the log, scanned on first record
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("LLM_TRAFFIC_MODE", "off").strip().lower(),
+                   os.getenv("LLM_TRAFFIC_LOG", "llm_traffic.jsonl"))
+
+    @staticmethod
+    def key(kind, request):
+        canonical = json.dumps([kind, request], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _entries(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    def _load(self):
+        # Loaded lazily so importing a stage in replay mode does not require the log
+        if not os.path.exists(self.path):
+            raise ReplayMiss(f"Replay log {self.path} not found; run with LLM_TRAFFIC_MODE=record first")
+        self.responses = {}
+        for entry in self._entries():
+            if 'key' in entry:
+                self.responses.setdefault(entry['key'], []).append(entry['response'])
+
+    def _compact(self, value, new_prompts):
+        """Request with long strings replaced by their hash; unseen texts go to new_prompts."""
+        if isinstance(value, str) and len(value) >= PROMPT_MIN_CHARS:
+            digest = hashlib.sha256(value.encode('utf-8')).hexdigest()[:16]
+            if digest not in self.prompts:
+                self.prompts.add(digest)
+                new_prompts.append({'prompt': digest, 'text': value})
+            return {'$prompt': digest}
+        if isinstance(value, dict):
+            return {k: self._compact(v, new_prompts) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._compact(v, new_prompts) for v in value]
+        return value
+
+    def record(self, kind, request, response):
+        if self.prompts is None:
+            self.prompts = set()
+            if os.path.exists(self.path):
+                self.prompts = {entry['prompt'] for entry in self._entries() if 'prompt' in entry}
+        new_prompts = []
+        entry = {'key': self.key(kind, request), 'kind': kind, 'ts': time.time(),
+                 'request': self._compact(request, new_prompts), 'response': response}
+        lines = [json.dumps(line, ensure_ascii=False, default=str) + '\n' for line in new_prompts + [entry]]
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(lines))
+
+    def replay(self, kind, request):
+        """
+        Return the recorded response for a request. Identical requests recorded several
+        times are served in recording order, repeating the last one once exhausted.
+        """
+        if self.responses is None:
+            self._load()
+        key = self.key(kind, request)
+        responses = self.responses.get(key)
+        if not responses:
+            raise ReplayMiss(f"No recorded {kind} response for this request")
+        index = self.served.get(key, 0)
+        self.served[key] = index + 1
+        return responses[min(index, len(responses) - 1)]
+
+
+TRAFFIC = TrafficLog.from_env()
+
+
+def _replayed(kind, request):
+    recorded = TRAFFIC.replay(kind, request)
+    if 'error' in recorded:
+        raise ReplayedError(recorded['error'])
+    return recorded
+
+
+@contextmanager
+def _recording_failures(kind, request):
+    """Record an exception raised by the call in the block as the call's response."""
+    try:
+        yield
+    except Exception as e:
+        if TRAFFIC.mode == 'record':
+            TRAFFIC.record(kind, request, {'error': f"{type(e).__name__}: {e}"})
+        raise
+
+
+class ReplayResponse:
+    """Minimal stand-in for requests.Response built from a recorded /api/analyze call."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            import requests
+            raise requests.exceptions.HTTPError(f"{self.status_code} (replayed)", response=self)
+
+
+class TextResponse:
+    """Minimal stand-in for a Gemini response; callers only read .text."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+def post_analyze(payload, url=ANALYZE_API_URL, timeout=30):
+    """POST to the /api/analyze service, recording or replaying the call as configured."""
+    if TRAFFIC.mode == 'replay':
+        recorded = _replayed('analyze', payload)
+        return ReplayResponse(recorded['status_code'], recorded['text'])
+
+    COSTS.check()
+    sent = payload
+    if COSTS.degraded and COSTS.degraded_key_type:
+        sent = dict(payload, keyType=COSTS.degraded_key_type)
+
+    import requests
+    with PROFILER.llm_call('analyze', sent) as call, _recording_failures('analyze', payload):
+        with track_wait('api'), call.phase('network'):
+            response = requests.post(url, json=sent, headers={"Content-Type": "application/json"}, timeout=timeout)
+        call.response = {'status_code': response.status_code, 'text': response.text}
+    if TRAFFIC.mode == 'record':
+        # Keyed by the caller's payload, which is what replay looks up, not the downgraded one
+        TRAFFIC.record('analyze', payload, {'status_code': response.status_code, 'text': response.text})
+    if response.status_code == 200:
+        try:
+            COSTS.record_analyze(sent, response.json())
+        except ValueError:
+            COSTS.record_analyze(sent, {})
+    return response
+
+
+class LoggedChat:
+    """
+    Wraps a Gemini chat so each send_message is recorded or replayed. A chat call is keyed
+    by the chat's identity and every message sent to it so far, since the response
+    depends on the whole conversation.
+    """
+
+    def __init__(self, chat, chat_id, model=None):
+        self.chat = chat
+        self.chat_id = chat_id
+        self.model = model
+        self.sent = []
+
+    def send_message(self, message):
+        self.sent.append(message)
+        request = {'chat': self.chat_id, 'messages': list(self.sent)}
+        if TRAFFIC.mode == 'replay':
+            return TextResponse(_replayed('gemini_chat', request)['text'])
+
+        COSTS.check()
+        with PROFILER.llm_call('gemini_chat', request) as call, _recording_failures('gemini_chat', request):
+            with track_wait('api'), call.phase('network'):
+                response = self.chat.send_message(message)
+            call.response = response.text
+        if TRAFFIC.mode == 'record':
+            TRAFFIC.record('gemini_chat', request, {'text': response.text})
+        COSTS.record_gemini(self.model, response, "\n".join(self.sent))
+        return response
+
+    def get_history(self):
+        return self.chat.get_history() if self.chat is not None else []
+
+
+def generate_content(client, model, contents, config, request_id):
+    """client.models.generate_content with record / replay; request_id names the prompt variant."""
+    request = {'model': model, 'id': request_id, 'contents': contents}
+    if TRAFFIC.mode == 'replay':
+        return TextResponse(_replayed('gemini_generate', request)['text'])
+
+    COSTS.check()
+    with PROFILER.llm_call('gemini_generate', request) as call, _recording_failures('gemini_generate', request):
+        with track_wait('api'), call.phase('network'):
+            response = client.models.generate_content(model=model, contents=contents, config=config)
+        call.response = response.text
+    if TRAFFIC.mode == 'record':
+        TRAFFIC.record('gemini_generate', request, {'text': response.text})
+    COSTS.record_gemini(model, response, contents)
+    return response
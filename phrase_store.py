@@ -0,0 +1,87 @@
+from array import array
+
+import numpy as np
+
+POSITIVE, NEGATIVE, OTHER = 1, -1, 0
+
+
+class PhraseStore:
+    """
+    Array-backed phrase pools of every project.
+
+    Each distinct phrase text is stored once and referred to by an integer id. Rows are
+    kept as parallel arrays of project id, phrase id, sentiment and stay duration, grouped
+    by project after finalize() so each project is a contiguous index range. Set making
+    then works on integer id arrays; phrase strings are only built for the output cells.
+    """
+
+    def __init__(self):
+        self.phrase_ids = {}  # phrase text -> id
+        self.texts = []  # id -> phrase text
+        self.project_ids = {}  # (xid, project name) -> id, in first-seen order
+        self.projects = []
+        self._project = array('i')
+        self._phrase = array('i')
+        self._sentiment = array('b')
+        self._duration = array('i')
+        self.offsets = None
+
+    def add(self, key, phrase, sentiment, duration):
+        if key not in self.project_ids:
+            self.project_ids[key] = len(self.projects)
+            self.projects.append(key)
+        if phrase not in self.phrase_ids:
+            self.phrase_ids[phrase] = len(self.texts)
+            self.texts.append(phrase)
+        self._project.append(self.project_ids[key])
+        self._phrase.append(self.phrase_ids[phrase])
+        self._sentiment.append(sentiment)
+        self._duration.append(duration)
+
+    def finalize(self):
+        """Group the rows by project, keeping their input order within a project."""
+        project = np.asarray(self._project, dtype=np.intc)
+        order = np.argsort(project, kind='stable')
+        self.phrase = np.asarray(self._phrase, dtype=np.intc)[order]
+        self.sentiment = np.asarray(self._sentiment, dtype=np.int8)[order]
+        self.duration = np.asarray(self._duration, dtype=np.intc)[order]
+        counts = np.bincount(project, minlength=len(self.projects))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._project = self._phrase = self._sentiment = self._duration = None
+
+    def __len__(self):
+        return len(self.projects)
+
+    def pool(self, index):
+        """PhrasePool of the index-th project."""
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return PhrasePool(self, self.phrase[start:end], self.sentiment[start:end], self.duration[start:end])
+
+
+class PhrasePool:
+    """One project's phrases as id arrays. Durations are per phrase, the last row winning."""
+
+    def __init__(self, store, phrase, sentiment, duration):
+        self.store = store
+        self.positives = phrase[sentiment == POSITIVE]
+        self.negatives = phrase[sentiment == NEGATIVE]
+        self.unique, last = np.unique(phrase[::-1], return_index=True)
+        self.unique_durations = duration[::-1][last]
+
+    def durations_of(self, ids):
+        return self.unique_durations[np.searchsorted(self.unique, ids)]
+
+    def texts(self, ids):
+        return [self.store.texts[i] for i in ids]
+
+    def durations(self):
+        """{phrase: duration} for the whole pool, as the phrase pool hash expects."""
+        return {self.store.texts[i]: int(d) for i, d in zip(self.unique, self.unique_durations)}
+
+    def format_set(self, positives, negatives):
+        """Output cells of a set: the '; ' joined phrase list and the average stay duration."""
+        texts = self.store.texts
+        formatted = [f"{texts[i]} (positive)" for i in positives] + [f"{texts[i]} (negative)" for i in negatives]
+        durations = self.durations_of(np.concatenate((positives, negatives)))
+        avg_duration = float(durations.mean()) if len(durations) else 0
+        return '; '.join(formatted), f"{avg_duration:.1f} Years"
@@ -1,19 +1,23 @@
 
-import pandas as pd
 import time
 import os
+import sys
 import csv
-import requests
 from dotenv import load_dotenv
 
+from storage import is_parquet, read_rows, stage_path, write_table
+from incremental import load_manifest, previous_rows, review_hash, save_manifest
+from llm_router import ROUTER, NoBackendAvailable
+from cost_tracker import COSTS, BudgetExceeded
+from llm_traffic import ReplayMiss
+from scheduling import prioritize, priority_scores, review_counts
+import progress
+from profiling import PROFILER
+
 load_dotenv()
 
 # API Setup
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment variables.")
-
-API_URL = 'http://new99acresposting:6009/api/analyze'
 
 system_instructions = """
 [You are a helpful assistant tasked with extracting concise, meaningful phrases from a homebuyer's review that express clear positive or negative sentiment about specific aspects of the property and its immediate surroundings.
@@ -42,6 +46,7 @@ system_instructions = """
 """
 
 def extract_phrases(review, sentiment):
+    """Phrases of a review as [{'Phrase', 'Sentiment'}], or None when the request failed."""
     prompt = f"""
     Review: "{review}"
     Overall Sentiment: {sentiment}
@@ -51,77 +56,113 @@ def extract_phrases(review, sentiment):
     """
     
     try:
-        data = {
-            "messages": [
-                {"role": "system", "content": system_instructions},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.8,
-            "keyType": "MINI"
-        }
-        
-        response = requests.post(API_URL, json=data, headers={"Content-Type": "application/json"}, timeout=30)
-        response.raise_for_status()
-        
-        response_data = response.json()
-        print(f"API Response: {response_data}")
+        messages = [
+            {"role": "system", "content": system_instructions},
+            {"role": "user", "content": prompt}
+        ]
+
+        result_text = ROUTER.complete('phrases', messages, temperature=0.8)
+        print(f"API Response: {result_text}")
 
         phrases = []
-        
-        if "result" in response_data:
-            result_text = response_data['result']
-            for line in result_text.split('\n'):
-                line = line.strip()
-                if not line:
-                    continue
+
+        with PROFILER.parse():
+            if result_text:
+                for line in result_text.split('\n'):
+                    line = line.strip()
+                    if not line:
+                        continue
                 
-                if line.startswith('"') and line.endswith('"'):
-                    phrase = line[1:-1]
-                    phrase_sentiment = "positive" if sentiment.lower() == "positive" else "negative"
-                elif '(' in line and ')' in line:
-                    parts = line.split('(')
-                    phrase = parts[0].strip().strip('"')
-                    phrase_sentiment = parts[1].split(')')[0].strip().lower()
-                else:
-                    phrase = line.strip('"')
-                    phrase_sentiment = sentiment.lower()
+                    if line.startswith('"') and line.endswith('"'):
+                        phrase = line[1:-1]
+                        phrase_sentiment = "positive" if sentiment.lower() == "positive" else "negative"
+                    elif '(' in line and ')' in line:
+                        parts = line.split('(')
+                        phrase = parts[0].strip().strip('"')
+                        phrase_sentiment = parts[1].split(')')[0].strip().lower()
+                    else:
+                        phrase = line.strip('"')
+                        phrase_sentiment = sentiment.lower()
                 
-                if phrase:
-                    phrases.append({
-                        'Phrase': phrase,
-                        'Sentiment': phrase_sentiment
-                    })
+                    if phrase:
+                        phrases.append({
+                            'Phrase': phrase,
+                            'Sentiment': phrase_sentiment
+                        })
         
         return phrases
 
-    except requests.exceptions.RequestException as e:
+    except NoBackendAvailable as e:
         print(f"API request failed: {e}")
-        return []
+        return None
+    except (BudgetExceeded, ReplayMiss):
+        raise
     except Exception as e:
         print(f"Phrase extraction error: {e}")
-        return []
+        return None
 
-def process_phrases(classified_file, phrase_output):
+@PROFILER.profiled('phrases:process_phrases')
+def process_phrases(classified_file, phrase_output, incremental=False, priority=False):
+    """
+    Extract phrases for every classified review into phrase_output.
+
+    With incremental=True, reviews already extracted by a previous run keep their phrases
+    and only new or changed reviews are sent to the API; reviews whose extraction failed
+    are not recorded as extracted and are retried on the next run. A review is only skipped
+    when its phrases are actually found in phrase_output, so an output overwritten by a
+    full run, or a review that gave no phrases, is extracted again. With priority=True, reviews are
+    processed project by project in scheduling priority order instead of file order.
+    """
     try:
         try:
-            df = pd.read_csv(classified_file)
+            with PROFILER.span('phrases:read_input'):
+                rows = read_rows(classified_file)
         except Exception as e:
             print(f"Error reading input file: {e}")
             return
 
         required_columns = ['xid', 'How Long do you stay here', 'Project name', 'Review', 'Sentiment']
-        if not all(col in df.columns for col in required_columns):
+        if rows and not all(col in rows[0] for col in required_columns):
             print(f"Input file missing required columns. Needs: {required_columns}")
             return
 
         os.makedirs(os.path.dirname(phrase_output) or '.', exist_ok=True)
+        fieldnames = ['xid', 'How Long do you stay here', 'Project name', 'Phrase', 'Sentiment']
+
+        counts = review_counts(rows)
+        previous_phrases = []
+        if incremental:
+            manifest = load_manifest()
+            for row in rows:
+                row['review_hash'] = row.get('review_hash') or review_hash(row)
+            current_hashes = {row['review_hash'] for row in rows}
+            recorded = set(manifest['phrased']) & current_hashes if os.path.exists(phrase_output) else set()
+            previous_phrases = previous_rows(phrase_output, recorded)
+            phrased = {r['review_hash'] for r in previous_phrases}
+            rows = [row for row in rows if row['review_hash'] not in phrased]
+            fieldnames = fieldnames + ['review_hash']
+            print(f"Incremental run: {len(phrased)} reviews already extracted, {len(rows)} to process")
+
+        if priority:
+            manifest = manifest if incremental else load_manifest()
+            scores = priority_scores(counts, counts, manifest['fresh'], {r['xid'] for r in previous_phrases})
+            rows = prioritize(rows, scores)
+
+        # CSV output is streamed row by row; Parquet is columnar so rows are collected
+        # and written once at the end.
+        parquet_rows = list(previous_phrases) if is_parquet(phrase_output) else None
+        csvfile = None if is_parquet(phrase_output) else open(phrase_output, 'w', newline='', encoding='utf-8')
+        try:
+            if csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(previous_phrases)
 
-        with open(phrase_output, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['xid', 'How Long do you stay here', 'Project name', 'Phrase', 'Sentiment']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
+            to_extract = sum(1 for row in rows if str(row['Review']).strip()
+                             and str(row['Sentiment']).strip().lower() in ['positive', 'negative'])
+            tracker = progress.Progress('phrases', to_extract)
 
-            for _, row in df.iterrows():
+            for row in rows:
                 review = str(row['Review']).strip()
                 if not review:
                     continue
@@ -130,28 +171,70 @@ def process_phrases(classified_file, phrase_output):
                 if sentiment not in ['positive', 'negative']:
                     continue
 
-                phrases_data = extract_phrases(review, sentiment)
+                COSTS.set_context('phrases', row['xid'])
+                try:
+                    phrases_data = extract_phrases(review, sentiment)
+                except BudgetExceeded as e:
+                    # Phrases written so far are kept; an --incremental rerun continues from here
+                    print(f"{e}; stopping phrase extraction")
+                    break
+                if phrases_data is None:
+                    print(f"Phrase extraction failed for review: {review[:50]}...")
+                    tracker.advance(failed=True)
+                    continue
                 print(f"Extracted {len(phrases_data)} phrases from review: {review[:50]}...")
 
                 for phrase_info in phrases_data:
-                    writer.writerow({
+                    phrase_row = {
                         'xid': row['xid'],
                         'How Long do you stay here': row['How Long do you stay here'],
                         'Project name': row['Project name'],
                         'Phrase': phrase_info['Phrase'],
                         'Sentiment': phrase_info['Sentiment']
-                    })
-                csvfile.flush()
+                    }
+                    if incremental:
+                        phrase_row['review_hash'] = row['review_hash']
+                    if csvfile:
+                        writer.writerow(phrase_row)
+                    else:
+                        parquet_rows.append(phrase_row)
+                if csvfile:
+                    csvfile.flush()
+                if incremental:
+                    phrased.add(row['review_hash'])
+                tracker.advance()
+            tracker.finish()
+        finally:
+            if csvfile:
+                csvfile.close()
+
+        if parquet_rows is not None:
+            import pandas as pd
+            write_table(pd.DataFrame(parquet_rows, columns=fieldnames), phrase_output, 'phrases')
+
+        if incremental:
+            manifest['phrased'] = sorted(phrased)
+            save_manifest(manifest)
 
         print(f"Successfully saved phrases to {phrase_output}")
+        print(f"LLM backends: {ROUTER.stats}")
+        print(COSTS.summary())
 
+    except ReplayMiss:
+        raise
     except Exception as e:
         print(f"Error in process_phrases: {e}")
 
-# Use relative paths in current working directory
-cwd = os.getcwd()
-classified_reviews_path = os.path.join(cwd, 'reviews.csv')
-phrases_output_path = os.path.join(cwd, 'phrases.csv')
+if __name__ == "__main__":
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY not found in environment variables.")
+
+    # Use relative paths in current working directory
+    cwd = os.getcwd()
+    classified_reviews_path = os.path.join(cwd, stage_path('reviews'))
+    phrases_output_path = os.path.join(cwd, stage_path('phrases'))
 
-# Run the script
-process_phrases(classified_reviews_path, phrases_output_path)
+    # Run the script; --incremental only extracts phrases for new or changed reviews,
+    # --priority processes the highest-priority projects first
+    process_phrases(classified_reviews_path, phrases_output_path, '--incremental' in sys.argv[1:],
+                    '--priority' in sys.argv[1:])
@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+from contextlib import contextmanager
+
+# Opt-in profiling of the pipeline, enabled with PIPELINE_PROFILE=1:
+#   - every LLM call records its wall time split into queue (rate limit and backoff waits
+#     since the previous call), network and parse time
+#   - stage functions and spans record their wall time; parse time of a request answered
+#     without a network call (local backends, replay) is recorded as parse:local
+#   - cProfile runs from the first stage span on, so module imports are left out
+# Every PROFILE_DUMP_SECONDS (default 300) and at exit, PROFILE_DIR (default profiles)
+# receives <tag>-<pid>.prof (pstats format, e.g. for `python -m pstats` or snakeviz) and
+# <tag>-<pid>-timings.json. Calls whose network time exceeds PROFILE_SLOW_SECONDS
+# (default 10) are appended with their full request and response to slow_requests.jsonl.
+# For sampling profiles, py-spy can be attached to the pid shown in pipeline_status.json.
+
+
+class CallRecord:
+    def __init__(self, kind, request, queue):
+        self.kind = kind
+        self.request = request
+        self.response = None
+        self.started_at = time.time()
+        self.timings = {'queue': queue, 'network': 0.0, 'parse': 0.0}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+
+class Profiler:
+    def __init__(self, enabled=False, directory='profiles', slow_seconds=10.0, dump_seconds=300.0, tag=None):
+        self.enabled = enabled
+        self.directory = directory
+        self.slow_seconds = slow_seconds
+        self.dump_seconds = dump_seconds
+        # Named after the running script, e.g. sentiment or review_generation
+        self.tag = tag or os.path.splitext(os.path.basename(sys.argv[0] or 'pipeline'))[0] or 'pipeline'
+        self.stats = {}  # hook name -> {'calls', 'wall', 'max', and the phases for LLM calls}
+        self.pending_queue = 0.0
+        self.last_call = None
+        self.slow_calls = 0
+        self._last_dump = time.time()
+        self._profile = None
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.dump)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.getenv("PIPELINE_PROFILE", "").strip().lower() in ("1", "true", "yes"),
+            directory=os.getenv("PROFILE_DIR", "profiles"),
+            slow_seconds=float(os.getenv("PROFILE_SLOW_SECONDS", "10")),
+            dump_seconds=float(os.getenv("PROFILE_DUMP_SECONDS", "300"))
+        )
+
+    def start(self):
+        """Start cProfile, if enabled and not running yet; called when a stage span opens."""
+        if self.enabled and self._profile is None:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def _record(self, name, wall, phases=None):
+        entry = self.stats.setdefault(name, {'calls': 0, 'wall': 0.0, 'max': 0.0})
+        entry['calls'] += 1
+        entry['wall'] += wall
+        entry['max'] = max(entry['max'], wall)
+        for phase, seconds in (phases or {}).items():
+            entry[phase] = entry.get(phase, 0.0) + seconds
+        if time.time() - self._last_dump >= self.dump_seconds:
+            self.dump()
+
+    def add_queue(self, seconds):
+        """Time spent waiting before the next LLM call (rate limit sleeps, retry backoff)."""
+        if self.enabled:
+            self.pending_queue += seconds
+
+    @contextmanager
+    def span(self, name):
+        """Record the wall time of a block under name."""
+        if not self.enabled:
+            yield
+            return
+        self.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - start)
+
+    def profiled(self, name):
+        """Decorator recording the wall time of every call of a stage function."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @contextmanager
+    def llm_call(self, kind, request):
+        """
+        Hook around one LLM call. The caller times the network part with
+        call.phase('network') and may set call.response; parse time is added afterwards
+        through parse().
+        """
+        call = CallRecord(kind, request, self.pending_queue)
+        self.pending_queue = 0.0
+        try:
+            yield call
+        finally:
+            if self.enabled:
+                self.last_call = call
+                self._record(f"llm:{kind}", call.timings['queue'] + call.timings['network'], call.timings)
+                if call.timings['network'] >= self.slow_seconds:
+                    self._save_slow(call)
+
+    def clear_call(self):
+        """Forget the most recent LLM call before a request that may be answered without one."""
+        self.last_call = None
+
+    @contextmanager
+    def parse(self):
+        """Attribute the block to the parse time of the most recent LLM call."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if self.last_call is not None:
+                self.last_call.timings['parse'] += seconds
+                self.stats[f"llm:{self.last_call.kind}"]['parse'] += seconds
+            else:
+                self._record('parse:local', seconds)
+
+    def _save_slow(self, call):
+        self.slow_calls += 1
+        entry = {
+            'kind': call.kind, 'pid': os.getpid(), 'started_at': call.started_at,
+            'timings': {phase: round(seconds, 3) for phase, seconds in call.timings.items()},
+            'request': call.request, 'response': call.response
+        }
+        with open(os.path.join(self.directory, 'slow_requests.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+    def dump(self):
+        """Write the cProfile stats and hook timings collected so far."""
+        if not self.enabled:
+            return
+        self._last_dump = time.time()
+        prefix = os.path.join(self.directory, f"{self.tag}-{os.getpid()}")
+        if self._profile is not None:
+            self._profile.disable()
+            try:
+                self._profile.dump_stats(f"{prefix}.prof")
+            finally:
+                self._profile.enable()
+        timings = {name: {k: round(v, 3) if isinstance(v, float) else v for k, v in entry.items()}
+                   for name, entry in self.stats.items()}
+        with open(f"{prefix}-timings.json", 'w', encoding='utf-8') as f:
+            json.dump({'slow_calls': self.slow_calls, 'timings': timings}, f, indent=1)
+
+
+PROFILER = Profiler.from_env()
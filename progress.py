@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from profiling import PROFILER
+
+# Progress reporting shared by the pipeline stages. Each running stage prints a progress
+# line every PROGRESS_INTERVAL seconds (default 30) and keeps its entry in the JSON status
+# file PIPELINE_STATUS_FILE (default pipeline_status.json) up to date:
+#   completed / failed / total, throughput over the last few minutes, seconds spent
+#   waiting on rate limits, on request jitter, on API calls and in retry backoff, and a
+#   projected finish time that accounts for the daily request quota when the stage has one.
+# The quota projection uses the requests this process drew from the rate limiter per item,
+# the same requests the quota counts, rather than every API call.
+# `python progress.py` shows a live dashboard of every stage in the status file.
+STATUS_FILE = os.getenv("PIPELINE_STATUS_FILE", "pipeline_status.json")
+INTERVAL_SECONDS = float(os.getenv("PROGRESS_INTERVAL", "30"))
+THROUGHPUT_WINDOW_SECONDS = 300
+WAIT_KINDS = ('rate_limit', 'jitter', 'api', 'backoff')
+
+_current = None
+
+
+class Progress:
+    def __init__(self, stage, total, quota=None, log=print, status_file=STATUS_FILE, interval=INTERVAL_SECONDS,
+                 shared=None):
+        """
+        quota is an optional callable returning (requests used today, daily request limit);
+        log receives the periodic progress line. shared is an optional callable returning
+        (completed, failed, total) for work split over several processes, such as queue
+        workers; the stage then reports those shared counts instead of this process's own.
+        """
+        global _current
+        self.stage = stage
+        self.log = log
+        self.total = total
+        self.quota = quota
+        self.status_file = status_file
+        self.interval = interval
+        self.shared = shared
+        self.completed = 0
+        self.failed = 0
+        self.processed = 0  # items handled by this process, whatever shared reports
+        self.api_calls = 0
+        self.quota_requests = 0
+        self.waits = {kind: 0.0 for kind in WAIT_KINDS}
+        self.started_at = time.time()
+        self.finished_at = None
+        self.recent = deque([(self.started_at, 0)])  # (time, completed) samples for throughput
+        self._last_report = 0.0
+        _current = self
+        if shared is not None:
+            self.completed, self.failed, self.total = shared()
+            self.recent = deque([(self.started_at, self.completed)])
+        self.report(force=True)
+
+    def advance(self, count=1, failed=False):
+        self.processed += count
+        if self.shared is not None:
+            self.completed, self.failed, self.total = self.shared()
+        else:
+            self.completed += count
+            if failed:
+                self.failed += count
+        now = time.time()
+        self.recent.append((now, self.completed))
+        while len(self.recent) > 2 and now - self.recent[0][0] > THROUGHPUT_WINDOW_SECONDS:
+            self.recent.popleft()
+        self.report()
+
+    def add_wait(self, kind, seconds):
+        self.waits[kind] += seconds
+        if kind == 'api':
+            self.api_calls += 1
+
+    def add_quota_request(self):
+        self.quota_requests += 1
+
+    def throughput(self):
+        """Items per second over the recent window."""
+        (start, done_start), (end, done_end) = self.recent[0], self.recent[-1]
+        return (done_end - done_start) / (end - start) if end > start else 0.0
+
+    def eta_seconds(self):
+        remaining = self.total - self.completed
+        if remaining <= 0:
+            return 0.0
+        rate = self.throughput()
+        if not rate:
+            return None
+        eta = remaining / rate
+        if self.quota is None:
+            return eta
+
+        # Items still possible today under the quota; the rest start after the daily reset
+        used, limit = self.quota()
+        per_item = self.quota_requests / self.processed if self.processed and self.quota_requests else 1.0
+        left_today = max(limit - used, 0) / per_item
+        if remaining <= left_today:
+            return eta
+        per_day = limit / per_item
+        if per_day <= 0:
+            return None
+        after_reset = remaining - left_today
+        days = math.ceil(after_reset / per_day)
+        now = datetime.now()
+        next_reset = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        last_day_items = after_reset - (days - 1) * per_day
+        return (next_reset - now).total_seconds() + (days - 1) * 86400 + last_day_items / rate
+
+    def status(self):
+        eta = self.eta_seconds()
+        status = {
+            'stage': self.stage,
+            'state': 'done' if self.finished_at else 'running',
+            'pid': os.getpid(),
+            'completed': self.completed,
+            'failed': self.failed,
+            'total': self.total,
+            'throughput_per_min': round(self.throughput() * 60, 2),
+            'api_calls': self.api_calls,
+            'quota_requests': self.quota_requests,
+            'wait_seconds': {kind: round(seconds, 1) for kind, seconds in self.waits.items()},
+            'elapsed_seconds': round((self.finished_at or time.time()) - self.started_at, 1),
+            'eta_seconds': None if eta is None else round(eta),
+            'projected_finish': None if eta is None else datetime.fromtimestamp(time.time() + eta).isoformat(timespec='seconds'),
+            'updated_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        if self.quota is not None:
+            used, limit = self.quota()
+            status['quota'] = {'used': used, 'limit': limit}
+        return status
+
+    def report(self, force=False):
+        now = time.time()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        status = self.status()
+        self.log(format_line(status))
+        try:
+            write_status(self.stage, status, self.status_file)
+        except OSError as e:
+            self.log(f"Could not write status file {self.status_file}: {e}")
+
+    def finish(self):
+        global _current
+        self.finished_at = time.time()
+        self.report(force=True)
+        if _current is self:
+            _current = None
+
+
+def format_line(status):
+    waits = status['wait_seconds']
+    eta = status['projected_finish'] or 'unknown'
+    return (f"[{status['stage']}] {status['completed']}/{status['total']} done ({status['failed']} failed), "
+            f"{status['throughput_per_min']}/min, waits: rate limit {waits['rate_limit']:.0f}s, "
+            f"jitter {waits.get('jitter', 0):.0f}s, api {waits['api']:.0f}s, backoff {waits['backoff']:.0f}s, ETA {eta}")
+
+
+def read_status(path=STATUS_FILE):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_status(stage, status, path=STATUS_FILE):
+    # Stages share the file, so merge this stage's entry into what is there
+    statuses = read_status(path)
+    statuses[stage] = status
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(statuses, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def track_wait(kind):
+    """Account the time spent in the block to the running stage's wait counters."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time() - start
+        if _current is not None:
+            _current.add_wait(kind, seconds)
+        if kind != 'api':
+            PROFILER.add_queue(seconds)
+
+
+def count_quota_request():
+    """Count a request drawn from a daily quota against the running stage."""
+    if _current is not None:
+        _current.add_quota_request()
+
+
+def sleep(seconds, kind):
+    """time.sleep that is reported as a rate limit, jitter or backoff wait."""
+    with track_wait(kind):
+        time.sleep(seconds)
+
+
+def dashboard(path=STATUS_FILE, refresh_seconds=2):
+    """Redraw the status of every stage until interrupted."""
+    try:
+        while True:
+            statuses = read_status(path)
+            lines = [f"Pipeline status ({path}) at {datetime.now():%H:%M:%S}", ""]
+            for stage, status in statuses.items():
+                total = status['total'] or 1
+                filled = int(30 * min(status['completed'] / total, 1))
+                lines.append(f"{stage:24} [{'#' * filled}{'.' * (30 - filled)}] {status['state']}")
+                lines.append(f"  {format_line(status)}")
+                if 'quota' in status:
+                    lines.append(f"  quota: {status['quota']['used']}/{status['quota']['limit']} requests today")
+            sys.stdout.write("\033[2J\033[H" + "\n".join(lines) + "\n")
+            sys.stdout.flush()
+            time.sleep(refresh_seconds)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    dashboard(sys.argv[1] if len(sys.argv) > 1 else STATUS_FILE)
@@ -0,0 +1,90 @@
+import time
+
+
+class PersonaCache:
+    """
+    Provider-side context cache for the persona system instructions.
+
+    Each persona prompt is uploaded once as Gemini cached content and chats reference it
+    by name instead of resending the prompt. Entries are refreshed shortly before their
+    TTL runs out. When caching is unavailable (disabled, unsupported model, prompt below
+    the minimum cacheable size, API error) get() returns None and the caller falls back
+    to sending the system instruction inline.
+    """
+
+    def __init__(self, client, model, ttl_seconds=3600, refresh_margin_seconds=120, enabled=True):
+        self.client = client
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.enabled = enabled
+        self.entries = {}  # persona key -> (cached content name, expires at)
+        self.uncacheable = set()
+        self.stats = {'created': 0, 'refreshed': 0, 'hits': 0, 'fallbacks': 0}
+
+    def get(self, key, prompt):
+        """Return the cached content name for a persona, creating or refreshing it as needed."""
+        if not self.enabled or key in self.uncacheable:
+            self.stats['fallbacks'] += 1
+            return None
+
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry and entry[1] - now > self.refresh_margin_seconds:
+            self.stats['hits'] += 1
+            return entry[0]
+
+        try:
+            from google.genai import types
+            if entry:
+                try:
+                    self.client.caches.update(
+                        name=entry[0],
+                        config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s")
+                    )
+                    self.entries[key] = (entry[0], now + self.ttl_seconds)
+                    self.stats['refreshed'] += 1
+                    return entry[0]
+                except Exception as e:
+                    # The entry may already have expired on the provider side; recreate it
+                    print(f"Could not refresh cached persona '{key}', recreating: {e}")
+
+            cache = self.client.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"review-persona-{key}",
+                    system_instruction=prompt,
+                    ttl=f"{self.ttl_seconds}s"
+                )
+            )
+            self.entries[key] = (cache.name, now + self.ttl_seconds)
+            self.stats['created'] += 1
+            print(f"Cached persona '{key}' as {cache.name} for {self.ttl_seconds}s")
+            return cache.name
+        except Exception as e:
+            print(f"Context caching unavailable for persona '{key}', sending it inline: {e}")
+            self.uncacheable.add(key)
+            self.entries.pop(key, None)
+            self.stats['fallbacks'] += 1
+            return None
+
+    def _delete(self, name):
+        try:
+            self.client.caches.delete(name=name)
+        except Exception as e:
+            print(f"Could not delete cached content {name}: {e}")
+
+    def invalidate(self, key):
+        """
+        Drop a persona's cache entry, e.g. after a chat using it failed, and delete it on the
+        provider side so it is not billed until its TTL runs out. The next get() recreates it.
+        """
+        entry = self.entries.pop(key, None)
+        if entry:
+            self._delete(entry[0])
+
+    def close(self):
+        """Delete the cached contents created by this run instead of waiting for their TTL."""
+        for name, _ in self.entries.values():
+            self._delete(name)
+        self.entries.clear()
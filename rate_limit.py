@@ -0,0 +1,71 @@
+import sqlite3
+import time
+from datetime import datetime
+
+import progress
+
+# Requests-per-minute and per-day limiter for the Gemini quota. Every request is logged in
+# a small SQLite table, so all processes opening the same file (queue workers, stages
+# falling back to Gemini) draw from one quota instead of each allowing the full rate. The
+# daily count restarts at local midnight and survives restarts of the process.
+
+
+class DailyLimitReached(Exception):
+    pass
+
+
+def _midnight(now):
+    return datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+class RateLimiter:
+    def __init__(self, max_requests_per_minute=15, max_requests_per_day=1500, path=None):
+        """path is the shared SQLite file; None keeps the request log in memory for this process."""
+        self.max_rpm = max_requests_per_minute
+        self.max_daily = max_requests_per_day
+        self.path = path
+        # Autocommit mode with explicit BEGIN IMMEDIATE, as in job_queue
+        self.conn = sqlite3.connect(path or ':memory:', timeout=30, isolation_level=None)
+        if path:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_requests (ts REAL NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS rate_limit_ts ON rate_limit_requests (ts)")
+
+    @property
+    def daily_count(self):
+        """Requests sent today by every process sharing the limiter."""
+        row = self.conn.execute("SELECT COUNT(*) FROM rate_limit_requests WHERE ts >= ?",
+                                (_midnight(time.time()),)).fetchone()
+        return row[0]
+
+    def acquire(self):
+        """
+        Wait until a request may be sent under both limits and record it. Raises
+        DailyLimitReached once today's quota is used.
+        """
+        while True:
+            now = time.time()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                daily = self.conn.execute("SELECT COUNT(*) FROM rate_limit_requests WHERE ts >= ?",
+                                          (_midnight(now),)).fetchone()[0]
+                in_minute, oldest = self.conn.execute(
+                    "SELECT COUNT(*), MIN(ts) FROM rate_limit_requests WHERE ts > ?", (now - 60,)
+                ).fetchone()
+                allowed = daily < self.max_daily and in_minute < self.max_rpm
+                if allowed:
+                    self.conn.execute("INSERT INTO rate_limit_requests (ts) VALUES (?)", (now,))
+                    progress.count_quota_request()
+                    self.conn.execute("DELETE FROM rate_limit_requests WHERE ts < ?", (now - 2 * 86400,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            if daily >= self.max_daily:
+                raise DailyLimitReached("Daily request limit reached")
+            if allowed:
+                return
+            progress.sleep(max(oldest + 60 - now, 0.05), 'rate_limit')
+
+    def close(self):
+        self.conn.close()
@@ -2,16 +2,24 @@
 import sys
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from google.generativeai import types
-import google.generativeai as genai
 import os, random
 import json
-import time
 import pandas as pd
-from google import genai
-from google.genai import types
-from collections import deque
-from datetime import datetime
+from typing import List
+
+from storage import append_table, is_parquet, phrase_list, read_table, stage_path
+from incremental import drop_xids, load_manifest, read_previous, save_manifest, sets_hash
+from job_queue import JobQueue
+from rate_limit import DailyLimitReached, RateLimiter
+from prompt_cache import PersonaCache
+from review_repair import load_json_object, merge_fields, normalize_review
+from similarity import SimilarityIndex
+from llm_traffic import TRAFFIC, LoggedChat, ReplayMiss, generate_content
+from cost_tracker import COSTS, BudgetExceeded
+from scheduling import prioritize, priority_scores, review_counts
+from llm_router import ROUTER, NoBackendAvailable, RoutedChat
+import progress
+from profiling import PROFILER
 
 class Review(BaseModel):
     positive_review: str
@@ -24,33 +32,11 @@ class Review(BaseModel):
     overall: str
     duration_of_stay: str
 
-class RateLimiter:
-    def __init__(self, max_requests_per_minute=15, max_requests_per_day=1500):
-        self.max_rpm = max_requests_per_minute
-        self.max_daily = max_requests_per_day
-        self.request_times = deque()
-        self.daily_count = 0
-        self.last_day_check = datetime.now().day
-
-    def check_limit(self):
-        now = datetime.now()
-        if now.day != self.last_day_check:
-            self.daily_count = 0
-            self.last_day_check = now.day
-        if self.daily_count >= self.max_daily:
-            raise Exception("Daily request limit reached")
-        while self.request_times and (now - self.request_times[0]).total_seconds() > 60:
-            self.request_times.popleft()
-        if len(self.request_times) >= self.max_rpm:
-            time_to_wait = 60 - (now - self.request_times[0]).total_seconds()
-            time.sleep(max(time_to_wait, 0))
-            now = datetime.now()
-        return True
-
-    def record_request(self):
-        now = datetime.now()
-        self.request_times.append(now)
-        self.daily_count += 1
+class SetReview(Review):
+    set_number: int
+
+class ProjectReviews(BaseModel):
+    reviews: List[SetReview]
 
 class GeminiReviewGenerator:
     __model_name = 'gemini-2.0-flash'
@@ -58,24 +44,53 @@ class GeminiReviewGenerator:
 
     def __init__(self):
         load_dotenv()
+        # LLM_TRAFFIC_MODE=replay serves recorded responses, so no client or API key is needed
+        replay = TRAFFIC.mode == 'replay'
         api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        if not api_key and not replay:
             raise ValueError("API key for Gemini is missing. Please set GEMINI_API_KEY in the .env file.")
-        self.__client = genai.Client(api_key=api_key)
-        self.rate_limiter = RateLimiter()
+        if replay:
+            self.__client = None
+        else:
+            # The Gemini SDK is slow to import, so it is only loaded once a generator is created
+            from google import genai
+            self.__client = genai.Client(api_key=api_key)
+        # Replayed runs are not rate limited and skip the jitter between requests. Otherwise the
+        # limiter state lives in GEMINI_RATE_LIMIT_DB, shared by every process using Gemini.
+        if replay:
+            self.rate_limiter = RateLimiter(float('inf'), float('inf'))
+        else:
+            self.rate_limiter = RateLimiter(path=os.getenv("GEMINI_RATE_LIMIT_DB", "gemini_rate_limit.db"))
+        self.request_jitter = (0, 0) if replay else (0.5, 1.5)
         # Changed to store chats by project_name AND set_number combination
         self.project_chats = {}  
+        self.__prompts = None
+        # Persona prompts are uploaded once as cached content and referenced by every chat.
+        # GEMINI_CONTEXT_CACHE=0 disables caching, GEMINI_CACHE_TTL sets the TTL in seconds.
+        self.persona_cache = PersonaCache(
+            self.__client,
+            self.__model_name,
+            ttl_seconds=int(os.getenv("GEMINI_CACHE_TTL", "3600")),
+            enabled=os.getenv("GEMINI_CONTEXT_CACHE", "1") != "0" and not replay
+        )
+        self.repair_stats = {'valid': 0, 'field_requests': 0, 'unrecoverable': 0}
+        # Near-duplicate reviews within a project are regenerated up to max_similarity_retries times.
+        # The index is shared through REVIEW_SIMILARITY_DB by queue workers and later runs;
+        # replayed runs keep it in memory so they only see the reviews they replay.
+        self.similarity = SimilarityIndex(
+            threshold=float(os.getenv("REVIEW_SIMILARITY_THRESHOLD", "0.5")),
+            path=None if replay else os.getenv("REVIEW_SIMILARITY_DB", "review_signatures.db")
+        )
+        self.max_similarity_retries = int(os.getenv("REVIEW_SIMILARITY_RETRIES", "1"))
 
     def __getPromptFromFile(self, type: str) -> str:
-        with open(GeminiReviewGenerator.__prompt_file_path, 'r') as file:
-            data = file.read()
-        parsed_data = json.loads(data)
-        return parsed_data.get(type)
+        # The prompt file is parsed once per generator rather than once per chat
+        if self.__prompts is None:
+            with open(GeminiReviewGenerator.__prompt_file_path, 'r') as file:
+                self.__prompts = json.loads(file.read())
+        return self.__prompts.get(type)
 
-    def _get_system_instruction_for_set(self, set_number):
-        """
-        Get the appropriate system instruction based on set number
-        """
+    def _get_instruction_key_for_set(self, set_number):
         # Define mapping of set numbers to system instruction keys
         instruction_mapping = {
             1: 'system_instruction_review_generator_resident',
@@ -85,50 +100,84 @@ class GeminiReviewGenerator:
         }
         
         # Get the instruction key for the set number, default to resident if not found
-        instruction_key = instruction_mapping.get(set_number, 'system_instruction_review_generator_resident')
-        return self.__getPromptFromFile(instruction_key)
+        return instruction_mapping.get(set_number, 'system_instruction_review_generator_resident')
+
+    def _get_system_instruction_for_set(self, set_number):
+        """
+        Get the appropriate system instruction based on set number
+        """
+        return self.__getPromptFromFile(self._get_instruction_key_for_set(set_number))
 
     def _initialize_chat_for_project_set(self, project_name, set_number):
         """
         Initialize a chat session for a specific project and set combination
         """
         # Get the appropriate system instruction for this set
+        instruction_key = self._get_instruction_key_for_set(set_number)
         prompt = self._get_system_instruction_for_set(set_number)
-        print(prompt)
         
         # Create unique key for project-set combination
         chat_key = f"{project_name}_set_{set_number}"
         
-        chat = self.__client.chats.create(
-            model=self.__model_name,
-            config=types.GenerateContentConfig(
-                temperature=0.8,
-                top_p=0.7,
-                system_instruction=[types.Part.from_text(text=prompt)],
-                response_mime_type='application/json',
-                response_schema=Review
-            )
-        )
-        
-        # Send initial context message
-        chat.send_message(
-            f"I will be generating a review for the project '{project_name}' (Set {set_number}). "
-            f"Please generate a review that matches the persona defined in the system instruction."
+        if not ROUTER.is_open('gemini'):
+            try:
+                # Chats are wrapped so their traffic can be recorded and replayed offline
+                config = self._generation_config(Review, instruction_key, prompt)
+                chat = LoggedChat(
+                    self.__client.chats.create(model=self.__model_name, config=config) if config is not None else None,
+                    f"{self.__model_name}:{instruction_key}:{chat_key}",
+                    model=self.__model_name
+                )
+
+                # Send initial context message
+                chat.send_message(
+                    f"I will be generating a review for the project '{project_name}' (Set {set_number}). "
+                    f"Please generate a review that matches the persona defined in the system instruction."
+                )
+                ROUTER.record_success('gemini')
+
+                self.project_chats[chat_key] = chat
+                print(f"Initialized chat session for project: {project_name} - Set {set_number}")
+                return
+            except BudgetExceeded:
+                raise
+            except Exception as e:
+                # A ReplayMiss lands here too: the recorded run used the fallback chat instead
+                ROUTER.record_failure('gemini')
+                print(f"Could not start Gemini chat for {project_name} - Set {set_number}: {e}")
+
+        # Gemini is unavailable: hold the conversation over the router's fallback backends
+        self.project_chats[chat_key] = RoutedChat(ROUTER, 'generation', prompt, response_schema=Review.model_json_schema())
+        print(f"Initialized fallback chat session for project: {project_name} - Set {set_number}")
+
+    def _generation_config(self, response_schema, cache_key, instruction):
+        """
+        Generation config referencing the cached instruction, or carrying it inline when
+        caching is unavailable. Returns None in replay mode, where nothing is sent.
+        """
+        if TRAFFIC.mode == 'replay':
+            return None
+        from google.genai import types
+        config = dict(
+            temperature=0.8,
+            top_p=0.7,
+            response_mime_type='application/json',
+            response_schema=response_schema
         )
-        
-        self.project_chats[chat_key] = chat
-        print(f"Initialized chat session for project: {project_name} - Set {set_number}")
+        cached_content = self.persona_cache.get(cache_key, instruction)
+        if cached_content:
+            config['cached_content'] = cached_content
+        else:
+            config['system_instruction'] = [types.Part.from_text(text=instruction)]
+        return types.GenerateContentConfig(**config)
 
-    def generate_review(self, project_info_df, project_name, set_number):
+    def generate_review(self, project_info_df, project_name, set_number, xid=None):
+        """Review JSON for one set; xid identifies the project in the similarity index."""
         print(f"Generating review for project '{project_name}' - Set {set_number}...")
         print(project_info_df)
         
-        if not self.rate_limiter.check_limit():
-            time.sleep(10)
-            return self.generate_review(project_info_df, project_name, set_number)
-        
-        self.rate_limiter.record_request()
-        time.sleep(random.uniform(0.5, 1.5))
+        self.rate_limiter.acquire()
+        progress.sleep(random.uniform(*self.request_jitter), 'jitter')
 
         # Create unique key for project-set combination
         chat_key = f"{project_name}_set_{set_number}"
@@ -152,39 +201,211 @@ class GeminiReviewGenerator:
         try:
             response = chat.send_message(message_content)
             review_json = response.text
+            if isinstance(chat, LoggedChat):
+                ROUTER.record_success('gemini')
+        except BudgetExceeded:
+            raise
         except Exception as e:
+            if isinstance(e, ReplayMiss) and not isinstance(chat, LoggedChat):
+                raise
             print(f'Gemini AI Chat execution threw an exception: {e}')
-            # Re-initialize chat on error
+            if isinstance(chat, LoggedChat):
+                ROUTER.record_failure('gemini')
+            # Re-initialize chat on error; the persona cache may have expired too
+            self.persona_cache.invalidate(self._get_instruction_key_for_set(set_number))
             self._initialize_chat_for_project_set(project_name, set_number)
             chat = self.project_chats.get(chat_key)
-            response = chat.send_message(message_content) if chat else None
+            try:
+                response = chat.send_message(message_content) if chat else None
+            except (BudgetExceeded, NoBackendAvailable):
+                raise
+            except Exception as e:
+                if isinstance(e, ReplayMiss) and not isinstance(chat, LoggedChat):
+                    raise
+                # The new Gemini chat failed as well; retry once over the fallback backends
+                print(f"Gemini chat failed again, using fallback backends: {e}")
+                ROUTER.record_failure('gemini')
+                chat = RoutedChat(ROUTER, 'generation', self._get_system_instruction_for_set(set_number),
+                                  response_schema=Review.model_json_schema())
+                self.project_chats[chat_key] = chat
+                response = chat.send_message(message_content)
             print(response)
             review_json = response.text if response else None
 
         if not review_json:
             return None
 
-        review_data = json.loads(review_json)
+        default_duration = self._default_duration(project_info_df)
+        review_data = self._parse_review(chat, review_json, default_duration, project_name, set_number)
+
+        project_key = project_name if xid is None else xid
+        retries = 0
+        while True:
+            duplicate, similarity = self.similarity.is_duplicate(project_key, set_number, self._review_text(review_data))
+            if not duplicate:
+                break
+            if retries >= self.max_similarity_retries or COSTS.degraded:
+                self.similarity.stats['accepted_duplicates'] += 1
+                print(f"Keeping near-duplicate review for {project_name} - Set {set_number} (similarity {similarity:.2f})")
+                break
+            retries += 1
+            self.similarity.stats['rejected'] += 1
+            print(f"Review for {project_name} - Set {set_number} is {similarity:.2f} similar to an earlier one, regenerating...")
+            try:
+                self.rate_limiter.acquire()
+                response = chat.send_message(
+                    "This review is too similar to a review already written for this project. Write it again "
+                    "in the same JSON format with different wording, structure and details, staying in your persona."
+                )
+                review_data = self._parse_review(chat, response.text, default_duration, project_name, set_number)
+            except ReplayMiss:
+                raise
+            except Exception as e:
+                # The review in hand is valid, so a failed regeneration keeps it rather than failing the set
+                self.similarity.stats['regeneration_failed'] += 1
+                print(f"Regeneration failed for {project_name} - Set {set_number}, keeping the earlier review: {e}")
+                break
+
+        self.similarity.add(project_key, set_number, self._review_text(review_data))
+        return json.dumps(review_data)
 
-        # Handle missing overall rating
-        if "overall" not in review_data:
-            fields = ["society_management", "green_area", "amenities", "connectivity", "construction"]
-            if all(review_data.get(field) in [None, "", "NA"] for field in fields):
-                review_data["overall"] = "NA"
-            else:
-                valid_ratings = [review_data.get(f) for f in fields if isinstance(review_data.get(f), (int, float))]
-                review_data["overall"] = round(sum(valid_ratings)/len(valid_ratings)) if valid_ratings else "NA"
+    def _review_text(self, review_data):
+        return f"{review_data.get('positive_review', '')} {review_data.get('negative_review', '')}"
 
-        # Handle missing fields
-        for field in ["society_management", "green_area", "amenities", "connectivity", "construction"]:
-            if review_data.get(field) is None:
-                review_data[field] = "NA"
+    def _parse_review(self, chat, review_json, default_duration, project_name, set_number):
+        """
+        Parse, normalise and, where needed, repair a review response from the chat
+        """
+        with PROFILER.parse():
+            try:
+                review_data = load_json_object(review_json)
+            except ValueError as e:
+                print(f"Could not parse review for {project_name} - Set {set_number}: {e}")
+                review_data = {}
 
-        # Handle duration of stay
-        if "duration_of_stay" not in review_data:
-            review_data["duration_of_stay"] = project_info_df['duration_of_stay'].iloc[0] if 'duration_of_stay' in project_info_df.columns else "NA"
+            review_data, failed = normalize_review(review_data, default_duration)
+        if failed:
+            review_data = self._repair_review_fields(chat, review_data, failed, default_duration)
+        else:
+            self.repair_stats['valid'] += 1
 
-        return json.dumps(review_data)
+        Review(**review_data)  # final schema check
+        return review_data
+
+    def _default_duration(self, project_info_df):
+        return project_info_df['duration_of_stay'].iloc[0] if 'duration_of_stay' in project_info_df.columns else "NA"
+
+    def _repair_review_fields(self, chat, review_data, failed, default_duration):
+        """
+        Ask the model again for only the fields that were missing or invalid and merge them
+        into the review. Raises ValueError when the review text itself cannot be recovered.
+        """
+        if COSTS.degraded:
+            # Close to the budget: keep the placeholders rather than paying for a repair request
+            if "positive_review" in failed:
+                self.repair_stats['unrecoverable'] += 1
+                raise ValueError("Generated review could not be repaired: positive_review missing")
+            return review_data
+
+        print(f"Requesting missing or invalid fields: {failed}")
+        self.repair_stats['field_requests'] += 1
+        self.rate_limiter.acquire()
+
+        message_content = f"""
+        Some fields of your previous review were missing, cut off or invalid: {', '.join(failed)}.
+        Reply in the same JSON format and fill in only these fields. Ratings are numbers from 1 to 5
+        (or "NA" when the data does not cover that aspect). The other fields can be left empty.
+        """
+        try:
+            response = chat.send_message(message_content)
+            with PROFILER.parse():
+                patch = load_json_object(response.text)
+                review_data, failed = normalize_review(merge_fields(review_data, patch, failed), default_duration)
+        except (BudgetExceeded, ReplayMiss):
+            raise
+        except Exception as e:
+            print(f"Field repair request failed: {e}")
+
+        if "positive_review" in failed:
+            self.repair_stats['unrecoverable'] += 1
+            raise ValueError("Generated review could not be repaired: positive_review missing")
+        return review_data
+
+    def _get_multi_set_instruction(self):
+        """
+        System instruction combining every persona, used when all sets of a project are
+        generated in one request
+        """
+        sections = [
+            "You will write one review per set for the same project. Each set has its own persona "
+            "below; write each set's review strictly following the persona for that set number, "
+            "so that the reviews read as written by different people.",
+        ]
+        for set_number in range(1, 5):
+            sections.append(f"=== Persona for Set {set_number} ===\n{self._get_system_instruction_for_set(set_number)}")
+        sections.append(
+            "Return a JSON object with a 'reviews' list containing exactly one review per requested set, "
+            "each with its 'set_number'."
+        )
+        return "\n\n".join(sections)
+
+    def generate_project_reviews(self, set_info_dfs, project_name, xid=None):
+        """
+        Generate the reviews for several sets of one project in a single request.
+
+        set_info_dfs maps set number -> project info DataFrame. Returns a dict of set number ->
+        review JSON containing only the items that validated against the Review model; callers
+        fall back to generate_review for the sets that are missing.
+        """
+        set_numbers = sorted(set_info_dfs)
+        print(f"Generating reviews for project '{project_name}' - Sets {set_numbers} in one request...")
+
+        self.rate_limiter.acquire()
+        progress.sleep(random.uniform(*self.request_jitter), 'jitter')
+
+        config = self._generation_config(ProjectReviews, 'multi_set', self._get_multi_set_instruction())
+
+        set_sections = "\n".join(
+            f"Set {s}: {set_info_dfs[s].to_json(orient='records')}" for s in set_numbers
+        )
+        message_content = f"""
+        Generate one detailed review per set for project '{project_name}' based on the following data:
+        {set_sections}
+        
+        Return exactly one review for each of the sets {set_numbers}, each written in the persona for its set.
+        """
+
+        response = generate_content(self.__client, self.__model_name, message_content, config, 'multi_set')
+        with PROFILER.parse():
+            items = load_json_object(response.text).get("reviews", []) if response and response.text else []
+
+        results = {}
+        for item in items:
+            try:
+                set_number = int(item.get("set_number"))
+            except (AttributeError, TypeError, ValueError):
+                continue
+            if set_number not in set_info_dfs or set_number in results:
+                continue
+            review_data, failed = normalize_review(item, self._default_duration(set_info_dfs[set_number]))
+            if failed:
+                print(f"Invalid review item for {project_name} - Set {set_number}: {failed}")
+                continue
+            Review(**review_data)  # final schema check
+            # Near-duplicates are left out so the per-set fallback regenerates them
+            project_key = project_name if xid is None else xid
+            duplicate, similarity = self.similarity.is_duplicate(project_key, set_number, self._review_text(review_data))
+            if duplicate:
+                self.similarity.stats['rejected'] += 1
+                print(f"Multi-set review for {project_name} - Set {set_number} is {similarity:.2f} similar to an earlier one")
+                continue
+            self.similarity.add(project_key, set_number, self._review_text(review_data))
+            results[set_number] = json.dumps(review_data)
+
+        missing = [s for s in set_numbers if s not in results]
+        if missing:
+            print(f"Multi-set response for {project_name} is missing valid reviews for sets {missing}")
+        return results
 
     def get_chat_history(self, project_name, set_number):
         """
@@ -200,9 +421,9 @@ class GeminiReviewGenerator:
         ]
 
 def prepare_project_info_df(pname, set_phrases, duration, set_number):
-    if not set_phrases or pd.isna(set_phrases) or set_phrases == "":
+    phrases = phrase_list(set_phrases)
+    if not phrases:
         return None
-    phrases = [p.strip() for p in set_phrases.split('\n') if p.strip()]
     positive = [p.replace(" (positive)", "") for p in phrases if "(positive)" in p]
     negative = [p.replace(" (negative)", "") for p in phrases if "(negative)" in p]
     neutral = [p for p in phrases if "(positive)" not in p and "(negative)" not in p]
@@ -215,61 +436,267 @@ def prepare_project_info_df(pname, set_phrases, duration, set_number):
         'set_number': [set_number]  # Added set_number to the dataframe
     })
 
-def main():
-    df = pd.read_csv("output_sets.csv")
+def failed_review_json(error):
+    return json.dumps({
+        "positive_review": f"Failed: {str(error)[:100]}", 
+        "negative_review": "",
+        "society_management": "NA", 
+        "green_area": "NA", 
+        "amenities": "NA",
+        "connectivity": "NA", 
+        "construction": "NA", 
+        "overall": "NA",
+        "duration_of_stay": "NA"
+    })
+
+def project_priorities(xids):
+    """Scheduling priority of each project, see scheduling.py."""
+    previous = read_previous(stage_path("structured_reviews"))
+    has_output = set(previous["xid"].astype(str)) if "xid" in previous.columns else set()
+    return priority_scores(xids, review_counts(), load_manifest()['fresh'], has_output)
+
+def enqueue_jobs(queue, priority=False):
+    """Queue one job per non-empty (xid, set) in output_sets, optionally with project priorities."""
+    df = read_table(stage_path("output_sets"))
+    scores = project_priorities(df["xid"]) if priority else {}
+    added = 0
+    for _, row in df.iterrows():
+        for s in range(1, 5):
+            value = phrase_list(row.get(f"Set {s}"))
+            if not value:
+                continue
+            added += queue.enqueue(row["xid"], row["Project name"], s, value, row.get(f"How Long do you stay here {s}", "NA"),
+                                   scores.get(str(row["xid"]), 0.0))
+    print(f"Queued {added} new jobs: {queue.counts()}")
+
+def queue_progress(queue):
+    """Callable returning the queue's (completed, failed, total) jobs, for progress.Progress."""
+    def counts():
+        counts = queue.counts()
+        finished = counts.get('done', 0) + counts.get('dead', 0)
+        return finished, counts.get('dead', 0), sum(counts.values())
+    return counts
+
+@PROFILER.profiled('generation:run_worker')
+def run_worker(queue, worker_id, only=None):
+    """
+    Generate reviews for queued jobs until the queue is drained or the daily quota is used.
+    only limits the worker to the given (xid, set_number) jobs.
+    """
+    gen = GeminiReviewGenerator()
+    try:
+        quota = lambda: (gen.rate_limiter.daily_count, gen.rate_limiter.max_daily)
+        if only is not None:
+            tracker = progress.Progress(f"generation:{worker_id}", len(only), quota=quota)
+        else:
+            # Workers share the queue, so they all report its counts under one stage entry
+            tracker = progress.Progress("generation:queue", None, quota=quota, shared=queue_progress(queue))
+        while True:
+            job = queue.lease(worker_id, only)
+            if job is None:
+                break
+            xid, pname, s = job["xid"], job["project_name"], job["set_number"]
+            pdf = prepare_project_info_df(pname, job["phrases"], job["duration"], s)
+            if pdf is None:
+                queue.complete(xid, s, worker_id, "")
+                tracker.advance()
+                continue
+            COSTS.set_context('generation', xid)
+            try:
+                print(f"[{worker_id}] Generating review for {pname} - Set {s} (attempt {job['attempts']})...")
+                rjson = gen.generate_review(pdf, pname, s, xid)
+                if not rjson:
+                    raise ValueError("Empty response from Gemini")
+                if queue.complete(xid, s, worker_id, rjson):
+                    print(f"✓ Success: {pname} - Set {s}")
+                else:
+                    print(f"[{worker_id}] Lease on {pname} - Set {s} expired, result discarded")
+                tracker.advance()
+            except DailyLimitReached:
+                queue.release(xid, s, worker_id)
+                print(f"[{worker_id}] Daily request limit reached, stopping worker")
+                break
+            except BudgetExceeded as e:
+                queue.release(xid, s, worker_id)
+                print(f"[{worker_id}] {e}, stopping worker")
+                break
+            except ReplayMiss:
+                # The replay diverged from the recording; stop rather than fail the job
+                queue.release(xid, s, worker_id)
+                raise
+            except Exception as e:
+                queue.fail(xid, s, worker_id, e)
+                print(f"Failed for {pname} (Set {s}): {str(e)[:100]}")
+                tracker.advance(failed=True)
+        tracker.finish()
+    finally:
+        # Provider-side caches are billed until deleted, so also clean up after an error
+        gen.persona_cache.close()
+    print(f"[{worker_id}] Worker finished: {queue.counts()} | persona cache: {gen.persona_cache.stats}")
+    print(f"[{worker_id}] Similarity guard: {gen.similarity.stats}, rejection rate {gen.similarity.rejection_rate():.1%}")
+    print(f"[{worker_id}] LLM backends: {ROUTER.stats}")
+    print(COSTS.summary())
+
+def export_jobs(queue):
+    """Write structured_reviews from the queue; dead-lettered sets keep the 'Failed:' placeholder."""
+    rows = {}
+    for job in queue.jobs():
+        pdata = rows.setdefault(job["xid"], {"xid": job["xid"], "Project name": job["project_name"],
+                                             **{f"Review {i}": "" for i in range(1, 5)}})
+        if job["state"] == "done":
+            pdata[f"Review {job['set_number']}"] = job["result"]
+        elif job["state"] == "dead":
+            pdata[f"Review {job['set_number']}"] = failed_review_json(job["last_error"])
+    output_file = stage_path("structured_reviews")
+    # Replace any earlier rows of the exported projects, keep everything else
+    drop_xids(output_file, set(rows), 'structured_reviews')
+    append_table(pd.DataFrame(list(rows.values())), output_file, 'structured_reviews')
+    print(f"Exported {len(rows)} projects to {output_file}")
+
+@PROFILER.profiled('generation:main')
+def main(incremental=False, multi_set=False, priority=False):
+    with PROFILER.span('generation:read_sets'):
+        df = read_table(stage_path("output_sets"))
     set_columns = [col for col in df.columns if col.startswith("Set ")]
-    output_file = "structured_reviews.csv"
+    output_file = stage_path("structured_reviews")
     
     # Create output file if it doesn't exist
-    if not os.path.exists(output_file):
+    if not is_parquet(output_file) and not os.path.exists(output_file):
         pd.DataFrame(columns=["xid", "Project name"] + [f"Review {i}" for i in range(1, len(set_columns)+1)]).to_csv(output_file, index=False)
     
+    if incremental:
+        # Only regenerate projects whose sets changed since their reviews were generated
+        manifest = load_manifest()
+        hash_columns = [c for c in df.columns if c.startswith("Set ") or c.startswith("How Long do you stay here")]
+        current = {str(row["xid"]): sets_hash(row, hash_columns) for _, row in df.iterrows()}
+        previous = read_previous(output_file)
+        existing = set(previous["xid"].astype(str)) if "xid" in previous.columns else set()
+        stale = {x for x in existing if manifest['generated'].get(x) != current.get(x)}
+        drop_xids(output_file, stale, 'structured_reviews')
+        for x in stale:
+            manifest['generated'].pop(x, None)
+        df = df[~df["xid"].astype(str).isin(existing - stale)]
+        save_manifest(manifest)
+        print(f"Incremental run: {len(existing - stale)} projects unchanged, {len(df)} to generate")
+
+    if priority:
+        # Highest-priority projects first, so a run cut off by the quota has covered them
+        scores = project_priorities(df["xid"])
+        df = df.loc[prioritize(df.index, scores, xid=lambda i: df.at[i, "xid"])]
+
     gen = GeminiReviewGenerator()
+    try:
+        tracker = progress.Progress("generation", len(df),
+                                    quota=lambda: (gen.rate_limiter.daily_count, gen.rate_limiter.max_daily))
 
-    for idx, (_, row) in enumerate(df.iterrows()):
-        xid, pname = row["xid"], row["Project name"]
-        print(f"\nProcessing project {idx+1}/{len(df)}: {pname} (ID: {xid})")
-        pdata = {"xid": xid, "Project name": pname}
+        for idx, (_, row) in enumerate(df.iterrows()):
+            xid, pname = row["xid"], row["Project name"]
+            print(f"\nProcessing project {idx+1}/{len(df)}: {pname} (ID: {xid})")
+            # Review columns are created up front so the appended row keeps the header's column order
+            pdata = {"xid": xid, "Project name": pname, **{f"Review {s}": "" for s in range(1, len(set_columns)+1)}}
+            COSTS.set_context('generation', xid)
+            # Every set of the project is generated again, so its earlier reviews are no reference
+            gen.similarity.forget(xid)
 
-        # Process each set with different system instructions
-        for s in range(1, len(set_columns)+1):
-            scol, dcol = f"Set {s}", f"How Long do you stay here {s}"
+            set_info_dfs = {}
+            budget_hit = False
+            failed_sets = 0
+            for s in range(1, len(set_columns)+1):
+                scol, dcol = f"Set {s}", f"How Long do you stay here {s}"
             
-            if scol not in row or pd.isna(row[scol]) or row[scol] == "":
-                pdata[f"Review {s}"] = ""
-                continue
+                # prepare_project_info_df returns None for empty or missing sets
+                if scol not in row:
+                    continue
             
-            pdf = prepare_project_info_df(pname, row[scol], row.get(dcol, "NA"), s)
-            if pdf is None:
-                pdata[f"Review {s}"] = ""
-                continue
+                pdf = prepare_project_info_df(pname, row[scol], row.get(dcol, "NA"), s)
+                if pdf is not None:
+                    set_info_dfs[s] = pdf
+
+            # --multi-set asks for every set of the project in one request first
+            batched = {}
+            # Close to the budget the single batched request is the cheaper mode
+            if (multi_set or COSTS.degraded) and set_info_dfs and not ROUTER.is_open('gemini'):
+                try:
+                    batched = gen.generate_project_reviews(set_info_dfs, pname, xid)
+                except BudgetExceeded:
+                    budget_hit = True
+                except ReplayMiss:
+                    raise
+                except Exception as e:
+                    print(f"Multi-set request failed for {pname}, falling back to per-set calls: {str(e)[:100]}")
+
+            # Process each set with different system instructions
+            for s, pdf in set_info_dfs.items():
+                if budget_hit:
+                    break
+                if s in batched:
+                    pdata[f"Review {s}"] = batched[s]
+                    print(f"✓ Success: {pname} - Set {s} (multi-set)")
+                    continue
                 
-            try:
-                print(f"Generating review for {pname} - Set {s} (using system instruction for set {s})...")
-                rjson = gen.generate_review(pdf, pname, s)
-                pdata[f"Review {s}"] = rjson
-                print(f"✓ Success: {pname} - Set {s}")
-            except Exception as e:
-                err_json = json.dumps({
-                    "positive_review": f"Failed: {str(e)[:100]}", 
-                    "negative_review": "",
-                    "society_management": "NA", 
-                    "green_area": "NA", 
-                    "amenities": "NA",
-                    "connectivity": "NA", 
-                    "construction": "NA", 
-                    "overall": "NA",
-                    "duration_of_stay": "NA"
-                })
-                pdata[f"Review {s}"] = err_json
-                print(f"Failed for {pname} (Set {s}): {str(e)[:100]}")
+                try:
+                    print(f"Generating review for {pname} - Set {s} (using system instruction for set {s})...")
+                    rjson = gen.generate_review(pdf, pname, s, xid)
+                    pdata[f"Review {s}"] = rjson
+                    print(f"✓ Success: {pname} - Set {s}")
+                except BudgetExceeded:
+                    budget_hit = True
+                except ReplayMiss:
+                    raise
+                except Exception as e:
+                    pdata[f"Review {s}"] = failed_review_json(e)
+                    print(f"Failed for {pname} (Set {s}): {str(e)[:100]}")
+                    failed_sets += 1
+
+            if budget_hit:
+                # The partial project is not saved, so it is generated in full on the next run
+                print(f"LLM budget used up, stopping before {pname}")
+                break
 
-        # Save data for this project
-        pd.DataFrame([pdata]).to_csv(output_file, mode='a', header=False, index=False)
-        print(f"Saved data for {pname} to {output_file}")
+            # Save data for this project
+            append_table(pd.DataFrame([pdata]), output_file, 'structured_reviews')
+            print(f"Saved data for {pname} to {output_file}")
+            if incremental and not failed_sets:
+                # Projects with failed sets stay out of the manifest and are regenerated next run
+                manifest['generated'][str(xid)] = current[str(xid)]
+                save_manifest(manifest)
+            tracker.advance(failed=failed_sets > 0)
 
+        tracker.finish()
+    finally:
+        gen.persona_cache.close()
     print(f"\nAll done! Generated reviews saved to {output_file}")
+    print(f"Persona cache: {gen.persona_cache.stats} | review repair: {gen.repair_stats}")
+    print(f"Similarity guard: {gen.similarity.stats}, rejection rate {gen.similarity.rejection_rate():.1%}")
     print(f"Processed {len(df)} projects with different system instructions for each set")
+    print(f"LLM backends: {ROUTER.stats}")
+    print(COSTS.summary())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Queue commands; several `worker` processes can share the same queue file:
+    #   enqueue       queue every set in output_sets; --priority leases important projects first
+    #   worker [id]   process queued sets
+    #   retry-failed  re-run only the dead-lettered sets
+    #   export        write structured_reviews from the queue results
+    command = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].startswith("--") else None
+    if command is None:
+        # --incremental skips projects whose sets are unchanged since the last run
+        # --multi-set generates all sets of a project in one request
+        # --priority generates the highest-priority projects first
+        main(incremental='--incremental' in sys.argv[1:], multi_set='--multi-set' in sys.argv[1:],
+             priority='--priority' in sys.argv[1:])
+    else:
+        queue = JobQueue()
+        if command == "enqueue":
+            enqueue_jobs(queue, priority='--priority' in sys.argv[2:])
+        elif command == "worker":
+            run_worker(queue, sys.argv[2] if len(sys.argv) > 2 else f"worker-{os.getpid()}")
+        elif command == "retry-failed":
+            requeued = queue.retry_dead()
+            print(f"Requeued {len(requeued)} dead-lettered jobs")
+            run_worker(queue, f"retry-{os.getpid()}", only=requeued)
+        elif command == "export":
+            export_jobs(queue)
+        else:
+            raise SystemExit(f"Unknown command: {command}")
+        queue.close()
\ No newline at end of file
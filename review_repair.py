@@ -0,0 +1,155 @@
+import json
+import re
+
+# Validation and local repair of review JSON returned by Gemini, so that most malformed
+# responses are fixed without paying for a full regeneration.
+
+TEXT_FIELDS = ["positive_review", "negative_review"]
+RATING_FIELDS = ["society_management", "green_area", "amenities", "connectivity", "construction"]
+REVIEW_FIELDS = TEXT_FIELDS + RATING_FIELDS + ["overall", "duration_of_stay"]
+MISSING_VALUES = {"", "na", "n/a", "n.a.", "none", "null", "-"}
+
+
+def extract_json_text(text):
+    """
+    Strip markdown fences and any prose around the outermost JSON object. A truncated
+    object is returned up to the end of the text, for repair_truncated_json.
+    """
+    text = text.strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```[a-zA-Z]*\s*", "", text)
+        text = re.sub(r"\s*```$", "", text)
+    start = text.find("{")
+    if start < 0:
+        return text
+    text = text[start:]
+    try:
+        _, end = json.JSONDecoder().raw_decode(text)
+    except json.JSONDecodeError:
+        return text
+    return text[:end]
+
+
+def repair_truncated_json(text):
+    """
+    Close a JSON document cut off mid-way. An unfinished string and any key left without
+    a value are dropped, so the affected field shows up as missing and can be requested
+    again, then every open object/array is closed.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    string_start = 0
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            string_start = index
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    repaired = text[:string_start] if in_string else text
+    repaired = re.sub(r'"(?:[^"\\]|\\.)*"\s*:\s*$', "", repaired.rstrip())
+    if stack and stack[-1] == "}":
+        # A complete key without its colon, e.g. {"a": "x", "b"
+        repaired = re.sub(r',\s*"(?:[^"\\]|\\.)*"\s*$', "", repaired)
+    repaired = repaired.rstrip().rstrip(",")
+    return repaired + "".join(reversed(stack))
+
+
+def load_json_object(text):
+    """Parse a JSON object, repairing truncation locally. Raises ValueError when impossible."""
+    if not text:
+        raise ValueError("Empty response")
+    text = extract_json_text(text)
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(repair_truncated_json(text))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Unrepairable JSON: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("Response is not a JSON object")
+    return data
+
+
+def coerce_rating(value):
+    """
+    Normalise a rating such as 4, 4.0, "4", "4/5", "4.5 out of 5" or "8/10" to a string on
+    the 1-5 scale; ratings given out of another scale are rescaled to 5. Returns "NA" for
+    missing values and None for values that cannot be read.
+    """
+    if value is None or (isinstance(value, str) and value.strip().lower() in MISSING_VALUES):
+        return "NA"
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        match = re.search(r"(\d+(?:\.\d+)?)(?:\s*(?:/|out of)\s*(\d+(?:\.\d+)?))?", str(value))
+        if not match:
+            return None
+        number = float(match.group(1))
+        if match.group(2) and float(match.group(2)) > 0:
+            number = number * 5 / float(match.group(2))
+    if not 0 < number <= 5:
+        return None
+    return str(int(number)) if number.is_integer() else str(round(number, 1))
+
+
+def compute_overall(review_data):
+    ratings = [float(review_data[f]) for f in RATING_FIELDS if review_data.get(f) not in (None, "NA")]
+    return str(round(sum(ratings) / len(ratings))) if ratings else "NA"
+
+
+def normalize_review(review_data, default_duration="NA"):
+    """
+    Coerce a parsed review to the Review schema.
+
+    Returns (review, failed_fields). Fields that are missing or unreadable are listed in
+    failed_fields and filled with a placeholder ("" for text, "NA" for ratings) so the
+    caller can ask the model again for just those fields. A missing overall rating is
+    computed from the aspect ratings and a missing duration uses default_duration.
+    """
+    review = {}
+    failed = []
+
+    for field in TEXT_FIELDS:
+        value = review_data.get(field)
+        if value is None or (field == "positive_review" and not str(value).strip()):
+            failed.append(field)
+            value = ""
+        review[field] = str(value)
+
+    for field in RATING_FIELDS:
+        rating = coerce_rating(review_data.get(field)) if field in review_data else None
+        if rating is None:
+            failed.append(field)
+            rating = "NA"
+        review[field] = rating
+
+    overall = coerce_rating(review_data.get("overall"))
+    review["overall"] = overall if overall not in (None, "NA") else compute_overall(review)
+
+    duration = review_data.get("duration_of_stay")
+    review["duration_of_stay"] = str(duration) if duration not in (None, "") else str(default_duration)
+
+    return review, failed
+
+
+def merge_fields(review_data, patch, fields):
+    """Copy only the given fields from a follow-up response onto a review."""
+    merged = dict(review_data)
+    for field in fields:
+        if field in patch:
+            merged[field] = patch[field]
+    return merged
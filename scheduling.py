@@ -0,0 +1,61 @@
+import os
+import math
+import time
+from collections import Counter
+
+from storage import read_rows, stage_path
+from incremental import get_xid
+
+# Priority order of projects, so that a run cut off by the daily quota or the LLM budget
+# has already spent its requests on the projects that matter most. A project's score is
+#   PRIORITY_WEIGHT_VOLUME  * share of reviews (log scaled against the largest project)
+# + PRIORITY_WEIGHT_RECENCY * freshness of its newest review, halving every
+#                             PRIORITY_HALF_LIFE_DAYS days (default 7)
+# + PRIORITY_WEIGHT_MISSING * 1 when the project has no output from the stage yet
+# Freshness comes from manifest['fresh'], which sentiment.py --incremental updates
+# whenever it classifies a new or changed review.
+WEIGHTS = {
+    'volume': float(os.getenv("PRIORITY_WEIGHT_VOLUME", "1.0")),
+    'recency': float(os.getenv("PRIORITY_WEIGHT_RECENCY", "1.0")),
+    'missing': float(os.getenv("PRIORITY_WEIGHT_MISSING", "2.0")),
+}
+HALF_LIFE_DAYS = float(os.getenv("PRIORITY_HALF_LIFE_DAYS", "7"))
+
+
+def review_counts(rows=None):
+    """Number of classified reviews per XID, from the given rows or the reviews stage."""
+    if rows is None:
+        path = stage_path('reviews')
+        rows = read_rows(path) if os.path.exists(path) else []
+    return Counter(get_xid(row) for row in rows)
+
+
+def mark_fresh(manifest, xids, now=None):
+    """Record that the given XIDs received new reviews."""
+    now = time.time() if now is None else now
+    for xid in xids:
+        manifest['fresh'][str(xid)] = now
+
+
+def priority_scores(xids, counts, fresh=None, has_output=(), now=None):
+    """Score every XID; higher scores are processed first."""
+    now = time.time() if now is None else now
+    fresh = fresh or {}
+    has_output = {str(x) for x in has_output}
+    largest = math.log1p(max(counts.values(), default=0)) or 1.0
+
+    scores = {}
+    for xid in {str(x) for x in xids}:
+        volume = math.log1p(counts.get(xid, 0)) / largest
+        recency = 0.0
+        if xid in fresh:
+            age_days = max(now - fresh[xid], 0) / 86400
+            recency = 0.5 ** (age_days / HALF_LIFE_DAYS)
+        missing = 0.0 if xid in has_output else 1.0
+        scores[xid] = WEIGHTS['volume'] * volume + WEIGHTS['recency'] * recency + WEIGHTS['missing'] * missing
+    return scores
+
+
+def prioritize(items, scores, xid=get_xid):
+    """Sort items by the score of their XID, highest first; ties keep their original order."""
+    return sorted(items, key=lambda item: -scores.get(str(xid(item)), 0.0))
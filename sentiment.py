@@ -2,14 +2,22 @@
 import pandas as pd
 import time
 import os
-import requests
-import openai
 from dotenv import load_dotenv
-import chardet
-from typing import Dict, List, Optional
+import json
+from typing import Dict, List, Optional, Tuple
 import logging
 import sys
 
+from phrases_extraction import system_instructions as PHRASE_INSTRUCTIONS, extract_phrases
+from storage import is_parquet, read_table, stage_path, write_table
+from incremental import load_manifest, previous_rows, review_hash, save_manifest
+from llm_router import ROUTER, NoBackendAvailable
+from cost_tracker import COSTS, BudgetExceeded
+from llm_traffic import ReplayMiss
+from scheduling import mark_fresh
+import progress
+from profiling import PROFILER
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,7 +31,6 @@ logging.basicConfig(
 # Load environment variables
 load_dotenv()
 
-openai.api_key = "dummy"  # Required by SDK, ignored by custom endpoint
 MODEL_ID = "gpt-4.0-mini"
 
 SYSTEM_INSTRUCTION = """
@@ -46,8 +53,23 @@ Analyze the actual content. Focus exclusively on property quality assessment.
 Return only one word as your classification: 'positive', 'negative', or 'ignore'.
 """
 
+FUSED_SYSTEM_INSTRUCTION = SYSTEM_INSTRUCTION.replace(
+    "Return only one word as your classification: 'positive', 'negative', or 'ignore'.",
+    ""
+) + PHRASE_INSTRUCTIONS + """
+Perform both tasks on the review in one pass. First classify it, then, only when the
+classification is 'positive' or 'negative', extract the phrases following the guidelines above.
+
+Return only a JSON object of the form:
+{"sentiment": "positive" | "negative" | "ignore", "phrases": [{"phrase": "...", "sentiment": "positive" | "negative"}]}
+Use an empty "phrases" list when the classification is 'ignore'.
+"""
+
+PHRASE_FIELDNAMES = ['xid', 'How Long do you stay here', 'Project name', 'Phrase', 'Sentiment']
+
 def detect_file_encoding(file_path: str) -> str:
     try:
+        import chardet  # only needed when reading the raw CSV export
         with open(file_path, 'rb') as f:
             result = chardet.detect(f.read())
         return result['encoding'] or 'utf-8'
@@ -55,34 +77,22 @@ def detect_file_encoding(file_path: str) -> str:
         logging.error(f"Error detecting file encoding: {e}")
         return 'utf-8'
 
-def classify_sentiment(review: str, max_retries: int = 3) -> str:
+def classify_sentiment(review: str, max_retries: int = 3) -> Tuple[str, bool]:
+    """
+    Classify a review as 'positive', 'negative' or 'ignore'. The flag is False when the
+    review could not be classified and was labelled 'ignore' in its place, or when only a
+    stopgap backend such as the lexicon answered; incremental runs do not record such
+    results, so the review is classified again on the next run.
+    """
     for attempt in range(max_retries):
         try:
             messages = [
                 {"role": "system", "content": SYSTEM_INSTRUCTION},
                 {"role": "user", "content": f'Review: "{review}"'}
             ]
-            
-            data = {
-                "messages": messages,
-                "temperature": 0.8,
-                "keyType": "MINI"
-            }
-
-            response = requests.post(
-                'http://new99acresposting:6009/api/analyze',
-                json=data,
-                headers={"Content-Type": "application/json"},
-                timeout=30
-            )
-
-            if response.status_code != 200:
-                logging.warning(f"Attempt {attempt + 1}: Received status code {response.status_code}")
-                time.sleep(2 ** attempt)
-                continue
-            
-            response_data = response.json()
-            sentiment = response_data.get("result", "").strip().lower()
+
+            sentiment, backend = ROUTER.complete_with_backend('sentiment', messages, temperature=0.8)
+            sentiment = sentiment.strip().lower()
             valid_sentiments = {'positive', 'negative', 'ignore'}
 
             if sentiment not in valid_sentiments:
@@ -90,39 +100,121 @@ def classify_sentiment(review: str, max_retries: int = 3) -> str:
                 sentiment = 'ignore'
 
             logging.info(f"Classified sentiment: {sentiment} for review: {review[:50]}...")
-            return sentiment
+            return sentiment, not ROUTER.is_stopgap(backend)
 
-        except requests.exceptions.RequestException as e:
-            logging.warning(f"Attempt {attempt + 1}: API request failed - {str(e)}")
-            time.sleep(2 ** attempt)
+        except NoBackendAvailable as e:
+            logging.warning(f"Attempt {attempt + 1}: {e}")
+            progress.sleep(2 ** attempt, 'backoff')
+        except (BudgetExceeded, ReplayMiss):
+            raise
         except Exception as e:
             logging.error(f"Unexpected error during classification: {e}")
             break
 
-    return 'ignore'
+    return 'ignore', False
+
+def _parse_fused_result(result_text: str) -> Tuple[str, List[Dict[str, str]]]:
+    text = result_text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    payload = json.loads(text)
+
+    sentiment = str(payload.get("sentiment", "")).strip().lower()
+    if sentiment not in {'positive', 'negative', 'ignore'}:
+        raise ValueError(f"Invalid sentiment in fused response: {sentiment}")
+
+    phrases = []
+    if sentiment != 'ignore':
+        for item in payload.get("phrases") or []:
+            phrase = str(item.get("phrase", "")).strip().strip('"')
+            phrase_sentiment = str(item.get("sentiment", sentiment)).strip().lower()
+            if phrase_sentiment not in {'positive', 'negative'}:
+                phrase_sentiment = sentiment
+            if phrase:
+                phrases.append({'Phrase': phrase, 'Sentiment': phrase_sentiment})
+    return sentiment, phrases
+
+def classify_and_extract(review: str, max_retries: int = 3) -> Tuple[str, List[Dict[str, str]], bool]:
+    """
+    Classify a review and extract its phrases with a single API call.
+
+    Falls back to the separate classify_sentiment / extract_phrases calls when the
+    fused response cannot be parsed. As with classify_sentiment, the flag is False when
+    the classification or the phrase extraction failed.
+    """
+    for attempt in range(max_retries):
+        try:
+            messages = [
+                {"role": "system", "content": FUSED_SYSTEM_INSTRUCTION},
+                {"role": "user", "content": f'Review: "{review}"'}
+            ]
+
+            result_text = ROUTER.complete('fused', messages, temperature=0.8)
+            with PROFILER.parse():
+                sentiment, phrases = _parse_fused_result(result_text)
+            logging.info(f"Classified sentiment: {sentiment} with {len(phrases)} phrases for review: {review[:50]}...")
+            return sentiment, phrases, True
+
+        except NoBackendAvailable as e:
+            logging.warning(f"Attempt {attempt + 1}: {e}")
+            progress.sleep(2 ** attempt, 'backoff')
+        except (BudgetExceeded, ReplayMiss):
+            raise
+        except (ValueError, AttributeError) as e:
+            logging.warning(f"Unparseable fused response, falling back to separate calls: {e}")
+            break
+        except Exception as e:
+            logging.error(f"Unexpected error during fused classification: {e}")
+            break
+
+    sentiment, classified = classify_sentiment(review, max_retries)
+    phrases = extract_phrases(review, sentiment) if sentiment in ['positive', 'negative'] else []
+    return sentiment, phrases or [], classified and phrases is not None
 
 def ensure_directory_exists(file_path: str) -> None:
     directory = os.path.dirname(file_path)
     if directory and not os.path.exists(directory):
         os.makedirs(directory, exist_ok=True)
 
-def process_sentiments(input_file: str, output_file: str, ignore_file: str) -> None:
-    try:
-        encoding = detect_file_encoding(input_file)
-        logging.info(f"Detected encoding: {encoding} for file: {input_file}")
+def read_input_csv(input_file: str) -> pd.DataFrame:
+    encoding = detect_file_encoding(input_file)
+    logging.info(f"Detected encoding: {encoding} for file: {input_file}")
 
-        try:
-            df = pd.read_csv(input_file, encoding=encoding)
-        except UnicodeDecodeError:
-            for fallback_encoding in ['windows-1252', 'iso-8859-1', 'latin1']:
-                try:
-                    df = pd.read_csv(input_file, encoding=fallback_encoding)
-                    logging.info(f"Successfully read with {fallback_encoding} encoding")
-                    break
-                except UnicodeDecodeError:
-                    continue
+    try:
+        return pd.read_csv(input_file, encoding=encoding)
+    except UnicodeDecodeError:
+        for fallback_encoding in ['windows-1252', 'iso-8859-1', 'latin1']:
+            try:
+                df = pd.read_csv(input_file, encoding=fallback_encoding)
+                logging.info(f"Successfully read with {fallback_encoding} encoding")
+                return df
+            except UnicodeDecodeError:
+                continue
+        raise ValueError("Failed to read file with any supported encoding")
+
+@PROFILER.profiled('sentiment:process_sentiments')
+def process_sentiments(input_file: str, output_file: str, ignore_file: str,
+                       phrase_file: Optional[str] = None, incremental: bool = False) -> None:
+    """
+    Classify every review in input_file into output_file / ignore_file.
+
+    When phrase_file is given, the fused mode is used: each review is classified and its
+    phrases extracted in one call, and the phrases are written in phrases.csv format.
+
+    With incremental=True only reviews missing from the processed manifest are sent to the
+    API; results for reviews still present in the input are carried over from the previous
+    outputs and rows for reviews no longer in the input are dropped. Reviews whose
+    classification failed are written but left out of the manifest, so the next run
+    classifies them again.
+    """
+    try:
+        with PROFILER.span('sentiment:read_input'):
+            if is_parquet(input_file):
+                df = read_table(input_file)
             else:
-                raise ValueError("Failed to read file with any supported encoding")
+                df = read_input_csv(input_file)
 
         # Clean column names
         df.columns = [col.strip() for col in df.columns]
@@ -132,19 +224,74 @@ def process_sentiments(input_file: str, output_file: str, ignore_file: str) -> N
 
         output_data = []
         ignore_data = []
+        phrase_data = []
+
+        if incremental:
+            manifest = load_manifest()
+            df['review_hash'] = [review_hash(row) for _, row in df.iterrows()]
+            # Only results recorded in the manifest are carried over, from the output matching
+            # the recorded sentiment; rows of earlier outputs missing from it (failed
+            # classifications) are classified again instead
+            known = {h: s for reviews in manifest['reviews'].values() for h, s in reviews.items()}
+            current_hashes = set(df['review_hash'])
+            output_data = previous_rows(output_file, {h for h in current_hashes if known.get(h) in ('positive', 'negative')})
+            ignore_data = previous_rows(ignore_file, {h for h in current_hashes if known.get(h) == 'ignore'})
+            if phrase_file:
+                # A classified review is only carried with its phrases, so a phrase file
+                # overwritten by a full run does not silently drop them
+                phrase_data = previous_rows(phrase_file, {r['review_hash'] for r in output_data})
+                phrased = {r['review_hash'] for r in phrase_data}
+                output_data = [r for r in output_data if r['review_hash'] in phrased]
+            carried_hashes = {r['review_hash'] for r in output_data + ignore_data}
+            df = df[~df['review_hash'].isin(carried_hashes)]
+            logging.info(f"Incremental run: {len(carried_hashes)} reviews unchanged, {len(df)} new or changed")
+
         total_reviews = len(df)
+        classified_xids = set()
+        failed_hashes = set()
         
         logging.info(f"Starting processing of {total_reviews} reviews...")
+        tracker = progress.Progress('sentiment', total_reviews, log=logging.info)
 
         for index, row in df.iterrows():
             review = str(row['Review']).strip()
             if not review:
+                tracker.advance()
                 continue
 
             duration = row.get('How Long do you stay here', 'N/A')
             logging.info(f"Processing review {index + 1}/{total_reviews} | Stay Duration: {duration}")
 
-            sentiment = classify_sentiment(review)
+            COSTS.set_context('sentiment', row.get('xid', row.get('XID')))
+            try:
+                if phrase_file:
+                    sentiment, phrases, classified = classify_and_extract(review)
+                else:
+                    (sentiment, classified), phrases = classify_sentiment(review), []
+            except BudgetExceeded as e:
+                # Keep what was classified so far; the remaining reviews are picked up by an --incremental rerun
+                logging.warning(f"{e}; stopping after {len(output_data) + len(ignore_data)} classified reviews")
+                break
+            if not classified:
+                if incremental:
+                    failed_hashes.add(row['review_hash'])
+                tracker.advance(failed=True)
+            else:
+                classified_xids.add(row.get('xid', row.get('XID')))
+                tracker.advance()
+
+            if phrase_file:
+                for phrase_info in phrases:
+                    phrase_row = {
+                        'xid': row.get('xid', row.get('XID')),
+                        'How Long do you stay here': duration,
+                        'Project name': row.get('Project name'),
+                        'Phrase': phrase_info['Phrase'],
+                        'Sentiment': phrase_info['Sentiment']
+                    }
+                    if incremental:
+                        phrase_row['review_hash'] = row['review_hash']
+                    phrase_data.append(phrase_row)
             row_data = row.to_dict()
 
             if sentiment in ['positive', 'negative']:
@@ -154,22 +301,41 @@ def process_sentiments(input_file: str, output_file: str, ignore_file: str) -> N
                 row_data['Ignore_Reason'] = "Ignored due to unclear sentiment or irrelevant content."
                 ignore_data.append(row_data)
 
-            if (index + 1) % 10 == 0:
-                logging.info(f"Processed {index + 1}/{total_reviews} reviews")
-
+        tracker.finish()
         ensure_directory_exists(output_file)
         ensure_directory_exists(ignore_file)
 
         if output_data:
             result_df = pd.DataFrame(output_data)
-            result_df.to_csv(output_file, index=False, encoding='utf-8')
+            write_table(result_df, output_file, 'reviews')
             logging.info(f"Saved {len(result_df)} classified reviews to {output_file}")
 
         if ignore_data:
             ignore_df = pd.DataFrame(ignore_data)
-            ignore_df.to_csv(ignore_file, index=False, encoding='utf-8')
+            write_table(ignore_df, ignore_file, 'ignore')
             logging.info(f"Saved {len(ignore_df)} ignored reviews to {ignore_file}")
 
+        if phrase_file:
+            phrase_columns = PHRASE_FIELDNAMES + ['review_hash'] if incremental else PHRASE_FIELDNAMES
+            write_table(pd.DataFrame(phrase_data, columns=phrase_columns), phrase_file, 'phrases')
+            logging.info(f"Saved {len(phrase_data)} phrases to {phrase_file}")
+
+        if incremental:
+            manifest['reviews'] = {}
+            classified = [(r, r['Sentiment']) for r in output_data] + [(r, 'ignore') for r in ignore_data]
+            for row_data, sentiment in classified:
+                if row_data['review_hash'] in failed_hashes:
+                    continue
+                xid = str(row_data.get('xid', row_data.get('XID')))
+                manifest['reviews'].setdefault(xid, {})[row_data['review_hash']] = sentiment
+            if phrase_file:
+                manifest['phrased'] = sorted({row_data['review_hash'] for row_data in output_data} - failed_hashes)
+            mark_fresh(manifest, classified_xids)
+            save_manifest(manifest)
+
+        logging.info(f"LLM backends: {ROUTER.stats}")
+        logging.info(COSTS.summary())
+
     except Exception as e:
         logging.error(f"Fatal error in process_sentiments: {e}", exc_info=True)
         raise
@@ -179,13 +345,17 @@ def main():
         os.chdir(r'C:\Users\jha.avinash\OneDrive - Info Edge (India) Ltd\Desktop\test_review')
 
         input_path = 'input.csv'
-        output_path = 'reviews.csv'
-        ignore_path = 'ignore.csv'
+        output_path = stage_path('reviews')
+        ignore_path = stage_path('ignore')
+        # --fused classifies and extracts phrases in one call per review
+        phrase_path = stage_path('phrases') if '--fused' in sys.argv[1:] else None
+        # --incremental only classifies reviews not seen by a previous run
+        incremental = '--incremental' in sys.argv[1:]
 
         logging.info("Starting sentiment analysis pipeline...")
         start_time = time.time()
         
-        process_sentiments(input_path, output_path, ignore_path)
+        process_sentiments(input_path, output_path, ignore_path, phrase_path, incremental)
         
         elapsed_time = time.time() - start_time
         logging.info(f"Analysis complete! Total processing time: {elapsed_time:.2f} seconds")
@@ -247,138 +247,152 @@
 
 
 import csv
-import random
 import re
-from collections import defaultdict
+import sys
 
-input_file = 'phrases.csv'
-output_file = 'output_sets.csv'
+import numpy as np
+
+from storage import is_parquet, iter_rows, phrase_text, stage_path, write_table
+from phrase_store import NEGATIVE, OTHER, POSITIVE, PhraseStore
+from incremental import load_manifest, pool_hash, read_previous, save_manifest
+import progress
+from profiling import PROFILER
+
+input_file = stage_path('phrases')
+output_file = stage_path('output_sets')
 
 def extract_years(text):
     match = re.search(r'(\d+)', text)
     return int(match.group(1)) if match else 0
 
-def distribute_phrases_equally(positives, negatives, durations, num_sets=4):
+def distribute_phrases_equally(pool, num_sets=4):
     """
     Distribute positive and negative phrases equally across 4 sets
     """
-    random.shuffle(positives)
-    random.shuffle(negatives)
-    
-    pos_per_set = len(positives) // num_sets
-    neg_per_set = len(negatives) // num_sets
-    
-    pos_remainder = len(positives) % num_sets
-    neg_remainder = len(negatives) % num_sets
-    
+    positives = np.random.permutation(pool.positives)
+    negatives = np.random.permutation(pool.negatives)
+
+    # array_split gives the first len % num_sets sets one extra phrase each
     sets = []
-    pos_index = 0
-    neg_index = 0
-    
-    for set_num in range(num_sets):
-        pos_count = pos_per_set + (1 if set_num < pos_remainder else 0)
-        neg_count = neg_per_set + (1 if set_num < neg_remainder else 0)
-        
-        set_positives = positives[pos_index:pos_index + pos_count]
-        set_negatives = negatives[neg_index:neg_index + neg_count]
-        
-        pos_index += pos_count
-        neg_index += neg_count
-        
-        if not set_positives and not set_negatives:
+    for set_positives, set_negatives in zip(np.array_split(positives, num_sets), np.array_split(negatives, num_sets)):
+        if not len(set_positives) and not len(set_negatives):
             continue
-        
-        formatted_phrases = []
-        formatted_phrases.extend([f"{p} (positive)" for p in set_positives])
-        formatted_phrases.extend([f"{n} (negative)" for n in set_negatives])
-        
-        all_phrases = set_positives + set_negatives
-        durations_list = [durations.get(p, 0) for p in all_phrases]
-        avg_duration = sum(durations_list) / len(durations_list) if durations_list else 0
-        
+
+        phrases, duration = pool.format_set(set_positives, set_negatives)
         sets.append({
-            'phrases': '; '.join(formatted_phrases),
-            'duration': f"{avg_duration:.1f} Years",
+            'phrases': phrases,
+            'duration': duration,
             'pos_count': len(set_positives),
             'neg_count': len(set_negatives)
         })
     
     return sets
 
-data = defaultdict(lambda: {'positives': [], 'negatives': [], 'durations': {}})
+# Phrases are interned once and kept in arrays, so catalogue-sized inputs stay compact
+store = PhraseStore()
 
-with open(input_file, 'r', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    for row in reader:
-        key = (row['xid'], row['Project name'])
-        phrase = row['Phrase']
+with PROFILER.span('sets:load_phrases'):
+    for row in iter_rows(input_file):
         sentiment = row['Sentiment'].lower()
-        duration = extract_years(row['How Long do you stay here'])
-
         if 'positive' in sentiment:
-            data[key]['positives'].append(phrase)
+            label = POSITIVE
         elif 'negative' in sentiment:
-            data[key]['negatives'].append(phrase)
+            label = NEGATIVE
+        else:
+            label = OTHER
+        store.add((row['xid'], row['Project name']), row['Phrase'], label,
+                  extract_years(row['How Long do you stay here']))
 
-        data[key]['durations'][phrase] = duration
+    store.finalize()
+
+# Prepare headers for exactly 4 sets
+headers = ['xid', 'Project name']
+for i in range(1, 5):
+    headers.append(f'Set {i}')
+    headers.append(f'How Long do you stay here {i}')
+
+def previous_cell(header, value):
+    if header.startswith('Set '):
+        return phrase_text(value)
+    if value is None or value != value:
+        return ''
+    return value
+
+# --incremental keeps the previous sets of every project whose phrase pool is unchanged
+incremental = '--incremental' in sys.argv[1:]
+if incremental:
+    manifest = load_manifest()
+    previous_sets = {str(r['xid']): r for r in read_previous(output_file).to_dict('records')}
+    pools = {}
 
 output_rows = []
 
-for (xid, project_name), sentiments in data.items():
-    positives = sentiments['positives']
-    negatives = sentiments['negatives']
-    durations = sentiments['durations']
-    
-    total_phrases = len(positives) + len(negatives)
-    
-    print(f"\n{xid} - {project_name}:")
-    print(f"  Total positives: {len(positives)}")
-    print(f"  Total negatives: {len(negatives)}")
-    print(f"  Total phrases: {total_phrases}")
-    
-    if total_phrases < 40:
-        print(f"  Creating 1 set (less than 40 phrases)")
-        formatted_phrases = []
-        formatted_phrases.extend([f"{p} (positive)" for p in positives])
-        formatted_phrases.extend([f"{n} (negative)" for n in negatives])
+tracker = progress.Progress('sets', len(store))
+
+with PROFILER.span('sets:build_sets'):
+    for index, (xid, project_name) in enumerate(store.projects):
+        tracker.advance()
+        pool = store.pool(index)
+        positives, negatives = pool.positives, pool.negatives
+
+        if incremental:
+            current_pool = pool_hash(pool.texts(positives), pool.texts(negatives), pool.durations())
+            pools[str(xid)] = current_pool
+            previous = previous_sets.get(str(xid))
+            if previous is not None and manifest['pools'].get(str(xid)) == current_pool:
+                print(f"\n{xid} - {project_name}: phrase pool unchanged, keeping previous sets")
+                output_rows.append([previous_cell(h, previous.get(h)) for h in headers])
+                continue
         
-        all_phrases = positives + negatives
-        durations_list = [durations.get(p, 0) for p in all_phrases]
-        avg_duration = sum(durations_list) / len(durations_list) if durations_list else 0
+        total_phrases = len(positives) + len(negatives)
         
-        sets = [{
-            'phrases': '; '.join(formatted_phrases),
-            'duration': f"{avg_duration:.1f} Years",
-            'pos_count': len(positives),
-            'neg_count': len(negatives)
-        }]
+        print(f"\n{xid} - {project_name}:")
+        print(f"  Total positives: {len(positives)}")
+        print(f"  Total negatives: {len(negatives)}")
+        print(f"  Total phrases: {total_phrases}")
         
-        print(f"    Set 1: {len(positives)} positives, {len(negatives)} negatives")
-    else:
-        print(f"  Distributing across 4 sets...")
-        sets = distribute_phrases_equally(positives, negatives, durations, 4)
-    
-    for i, set_data in enumerate(sets, 1):
-        print(f"    Set {i}: {set_data['pos_count']} positives, {set_data['neg_count']} negatives")
-    
-    row = [xid, project_name]
-    for set_data in sets:
-        row.append(set_data['phrases'])
-        row.append(set_data['duration'])
-    
-    output_rows.append(row)
+        if total_phrases < 40:
+            print(f"  Creating 1 set (less than 40 phrases)")
+            phrases, duration = pool.format_set(positives, negatives)
+            
+            sets = [{
+                'phrases': phrases,
+                'duration': duration,
+                'pos_count': len(positives),
+                'neg_count': len(negatives)
+            }]
+            
+            print(f"    Set 1: {len(positives)} positives, {len(negatives)} negatives")
+        else:
+            print(f"  Distributing across 4 sets...")
+            sets = distribute_phrases_equally(pool, 4)
+        
+        for i, set_data in enumerate(sets, 1):
+            print(f"    Set {i}: {set_data['pos_count']} positives, {set_data['neg_count']} negatives")
+        
+        row = [xid, project_name]
+        for set_data in sets:
+            row.append(set_data['phrases'])
+            row.append(set_data['duration'])
+        
+        output_rows.append(row)
 
-# Prepare headers for exactly 4 sets
-headers = ['xid', 'Project name']
-for i in range(1, 5):
-    headers.append(f'Set {i}')
-    headers.append(f'How Long do you stay here {i}')
+tracker.finish()
+
+for row in output_rows:
+    row += [''] * (len(headers) - len(row))  # pad missing columns
+
+if is_parquet(output_file):
+    import pandas as pd
+    write_table(pd.DataFrame(output_rows, columns=headers), output_file, 'output_sets')
+else:
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(headers)
+        writer.writerows(output_rows)
 
-with open(output_file, 'w', newline='', encoding='utf-8') as f:
-    writer = csv.writer(f)
-    writer.writerow(headers)
-    for row in output_rows:
-        row += [''] * (len(headers) - len(row))  # pad missing columns
-        writer.writerow(row)
+if incremental:
+    manifest['pools'] = pools
+    save_manifest(manifest)
 
 print(f"\nOutput saved to {output_file}")
@@ -0,0 +1,97 @@
+import re
+import zlib
+import random
+import sqlite3
+from array import array
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+class SimilarityIndex:
+    """
+    Per-project MinHash index over word shingles of the reviews generated so far.
+
+    The estimated Jaccard similarity of a new review against the reviews of the project's
+    other sets is computed on the CPU; anything at or above the threshold is reported as a
+    near-duplicate so the caller can regenerate it. Signatures are kept in a SQLite file
+    when path is given, so queue workers and later runs see each other's reviews; path=None
+    keeps them in memory for this process.
+    """
+
+    def __init__(self, threshold=0.5, num_perm=64, shingle_size=3, seed=1, path=None):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self.permutations = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        self.conn = sqlite3.connect(path or ':memory:', timeout=30, isolation_level=None)
+        if path:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS review_signatures (
+                project TEXT NOT NULL,
+                set_number INTEGER NOT NULL,
+                signature BLOB NOT NULL,
+                PRIMARY KEY (project, set_number)
+            )
+        """)
+        # rejected counts reviews sent back for regeneration, accepted_duplicates the
+        # near-duplicates kept once the retries ran out and regeneration_failed those kept
+        # because the regeneration request failed
+        self.stats = {'checked': 0, 'rejected': 0, 'accepted_duplicates': 0, 'regeneration_failed': 0}
+
+    def _shingles(self, text):
+        words = re.findall(r"[a-z0-9']+", str(text).lower())
+        if len(words) < self.shingle_size:
+            return {" ".join(words)} if words else set()
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in self._shingles(text)]
+        if not hashes:
+            return None
+        return [
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self.permutations
+        ]
+
+    def max_similarity(self, project, set_number, text):
+        """Highest estimated Jaccard similarity of text to the review of another set of the project."""
+        signature = self.signature(text)
+        if signature is None:
+            return 0.0
+        best = 0.0
+        rows = self.conn.execute(
+            "SELECT signature FROM review_signatures WHERE project = ? AND set_number != ?",
+            (str(project), int(set_number))
+        )
+        for (blob,) in rows:
+            other = array('I', blob)
+            matches = sum(1 for x, y in zip(signature, other) if x == y)
+            best = max(best, matches / len(signature))
+        return best
+
+    def is_duplicate(self, project, set_number, text):
+        """Return (is_duplicate, similarity) and count the check."""
+        similarity = self.max_similarity(project, set_number, text)
+        self.stats['checked'] += 1
+        return similarity >= self.threshold, similarity
+
+    def add(self, project, set_number, text):
+        """Store the review of a set, replacing an earlier review of the same set."""
+        signature = self.signature(text)
+        if signature is not None:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO review_signatures (project, set_number, signature) VALUES (?, ?, ?)",
+                (str(project), int(set_number), array('I', signature).tobytes())
+            )
+
+    def forget(self, project):
+        """Drop a project's reviews, e.g. before all of its sets are generated again."""
+        self.conn.execute("DELETE FROM review_signatures WHERE project = ?", (str(project),))
+
+    def rejection_rate(self):
+        return self.stats['rejected'] / self.stats['checked'] if self.stats['checked'] else 0.0
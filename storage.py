@@ -0,0 +1,175 @@
+import os
+import re
+import csv
+import json
+
+# pandas (and pyarrow behind it) is imported inside the functions that need it so that
+# CSV-only stages and short CLI runs do not pay its import cost.
+
+# Stage outputs are CSV by default. Set REVIEW_STORAGE=parquet to store every
+# intermediate (reviews, ignore, phrases, output_sets, structured_reviews,
+# processed_reviews, project_summary) as Parquet with typed columns instead.
+STORAGE_FORMAT = os.getenv("REVIEW_STORAGE", "csv").strip().lower()
+
+REVIEW_FIELDS = [
+    "positive_review", "negative_review", "society_management", "green_area",
+    "amenities", "connectivity", "construction", "overall", "duration_of_stay"
+]
+RATING_FIELDS = ["society_management", "green_area", "amenities", "connectivity", "construction"]
+
+# Column kinds per stage, only applied when writing Parquet:
+#   category    - low-cardinality labels such as sentiment
+#   years       - adds a float '<column> (years)' next to a free-text duration
+#   phrase_list - '; ' joined phrase string stored as list<string>
+#   review      - review JSON string stored as a struct of REVIEW_FIELDS
+#   rating      - numeric rating stored as float32, keeping half points ('NA' becomes null)
+SCHEMAS = {
+    "reviews": {"Sentiment": "category", "How Long do you stay here": "years"},
+    "ignore": {"How Long do you stay here": "years"},
+    "phrases": {"Sentiment": "category", "How Long do you stay here": "years"},
+    "output_sets": {f"Set {i}": "phrase_list" for i in range(1, 5)},
+    "structured_reviews": {f"Review {i}": "review" for i in range(1, 5)},
+    "processed_reviews": {**{f: "rating" for f in RATING_FIELDS}, "overall_rating": "rating"},
+}
+
+
+def stage_path(name):
+    """Return the file name for a stage output in the configured storage format."""
+    extension = "parquet" if STORAGE_FORMAT == "parquet" else "csv"
+    return f"{name}.{extension}"
+
+
+def is_parquet(path):
+    return str(path).rstrip("/\\").endswith(".parquet")
+
+
+def extract_years(text):
+    match = re.search(r'(\d+(?:\.\d+)?)', str(text))
+    return float(match.group(1)) if match else None
+
+
+def phrase_list(value):
+    """
+    Phrases of a set cell as a list. Parquet stores a set as a list of phrases, CSV as a
+    '; ' joined string; empty and missing cells give an empty list.
+    """
+    if value is not None and not isinstance(value, str) and hasattr(value, '__len__'):
+        return [str(p).strip() for p in value if str(p).strip()]
+    if not isinstance(value, str):
+        return []
+    return [p.strip() for p in re.split(r'[;\n]', value) if p.strip()]
+
+
+def phrase_text(value):
+    """A set cell as the '; ' joined string stored in CSV."""
+    return '; '.join(phrase_list(value))
+
+
+def _review_struct(value):
+    if isinstance(value, dict):
+        data = value
+    elif isinstance(value, str) and value.strip():
+        try:
+            data = json.loads(value)
+        except json.JSONDecodeError:
+            return None
+    else:
+        return None
+    return {field: None if data.get(field) is None else str(data.get(field)) for field in REVIEW_FIELDS}
+
+
+def _apply_schema(df, schema):
+    import pandas as pd
+    df = df.copy()
+    for column, kind in schema.items():
+        if column not in df.columns:
+            continue
+        if kind == "category":
+            df[column] = df[column].astype("category")
+        elif kind == "years":
+            df[f"{column} (years)"] = df[column].map(extract_years).astype("float32")
+        elif kind == "phrase_list":
+            df[column] = df[column].map(lambda value: phrase_list(value) or None)
+        elif kind == "review":
+            df[column] = df[column].map(_review_struct)
+        elif kind == "rating":
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float32")
+    for column in ("xid", "XID"):
+        if column in df.columns:
+            df[column] = df[column].astype(str)
+    return df
+
+
+def _write_parquet(df, path, stage):
+    """
+    Write a frame as Parquet with the stage's schema. List and struct columns get explicit
+    Arrow types, so a part file in which such a column is empty everywhere is not typed
+    null and still reads back together with the other parts.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = SCHEMAS.get(stage, {})
+    df = _apply_schema(df, schema)
+    arrow_types = {
+        "phrase_list": pa.list_(pa.string()),
+        "review": pa.struct([(field, pa.string()) for field in REVIEW_FIELDS]),
+    }
+    arrow_schema = pa.Schema.from_pandas(df, preserve_index=False)
+    for column, kind in schema.items():
+        if kind in arrow_types and column in df.columns:
+            index = arrow_schema.get_field_index(column)
+            arrow_schema = arrow_schema.set(index, pa.field(column, arrow_types[kind]))
+    pq.write_table(pa.Table.from_pandas(df, schema=arrow_schema, preserve_index=False), path)
+
+
+def read_table(path, **csv_kwargs):
+    """Read a stage table. Parquet paths may be a single file or a directory of parts."""
+    import pandas as pd
+    if is_parquet(path):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, **csv_kwargs)
+
+
+def read_rows(path):
+    """Read a stage table as a list of dicts of strings, like csv.DictReader, without pandas for CSV."""
+    if is_parquet(path):
+        df = read_table(path)
+        df = df.astype(object).where(df.notna(), '')
+        return df.astype(str).to_dict('records')
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def iter_rows(path):
+    """Like read_rows, but streams CSV rows one at a time instead of loading the file."""
+    if is_parquet(path):
+        yield from read_rows(path)
+        return
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f)
+
+
+def write_table(df, path, stage=None):
+    """Write a stage table, applying the stage's typed schema when writing Parquet."""
+    directory = os.path.dirname(str(path))
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if is_parquet(path):
+        _write_parquet(df, path, stage)
+    else:
+        df.to_csv(path, index=False, encoding='utf-8')
+
+
+def append_table(df, path, stage=None):
+    """
+    Append rows to a stage table.
+
+    CSV files are appended in place. Parquet tables are directories of part files so each
+    append is a new part and nothing already written is rewritten.
+    """
+    if is_parquet(path):
+        os.makedirs(path, exist_ok=True)
+        part = os.path.join(path, f"part-{len(os.listdir(path)):05d}.parquet")
+        _write_parquet(df, part, stage)
+    else:
+        df.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
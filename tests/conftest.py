@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The pipeline modules are flat scripts at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the shared cost ledger of imported modules out of the working directory
+os.environ.setdefault("LLM_COST_LEDGER", ":memory:")
+os.environ.setdefault("LLM_TRAFFIC_MODE", "off")
@@ -0,0 +1,72 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from analytics import build_summary, load_summary, write_summary
+from storage import write_table
+
+
+def processed_reviews():
+    return pd.DataFrame({
+        "xid": [101, 101, 101, 102],
+        "project_name": ["Green Acres", "Green Acres", "Green Acres", "Lake View"],
+        "society_management": ["4", "2.5", "NA", "3.5"],
+        "green_area": ["5", "4", "3", "1"],
+        "amenities": ["NA", "NA", "NA", "2"],
+        "connectivity": ["3", "3", "4", "5"],
+        "construction": ["1.5", "2", "4.5", "3"],
+        "overall_rating": ["3.5", "3", "4", "2.5"],
+        "duration_of_stay": ["2 years", "1 year", "", "5 years"],
+    })
+
+
+def phrases():
+    return pd.DataFrame({
+        "xid": [101, 101, 101, 102],
+        "Phrase": ["Quiet streets", "quiet streets", "water leakage", "good metro access"],
+        "Sentiment": ["positive", "positive", "negative", "positive"],
+    })
+
+
+@pytest.fixture(params=["csv", "parquet"])
+def summary(request, tmp_path):
+    reviews_path = str(tmp_path / f"processed_reviews.{request.param}")
+    phrases_path = str(tmp_path / f"phrases.{request.param}")
+    write_table(processed_reviews(), reviews_path, "processed_reviews")
+    write_table(phrases(), phrases_path, "phrases")
+    return build_summary(reviews_path, phrases_path)
+
+
+def test_summary_counts_and_distributions(summary):
+    green_acres = summary.loc["101"]
+    assert green_acres["reviews"] == 3
+    assert green_acres["society_management_n"] == 2
+    assert green_acres["society_management_mean"] == 3.25
+    # Half points round up: 2.5 counts as a 3, 3.5 as a 4
+    assert green_acres[[f"society_management_{s}" for s in range(1, 6)]].tolist() == [0, 0, 1, 1, 0]
+    assert green_acres[[f"construction_{s}" for s in range(1, 6)]].tolist() == [0, 2, 0, 0, 1]
+    assert summary.loc["102", "overall_rating_3"] == 1
+    assert green_acres["amenities_n"] == 0
+    assert green_acres["positive_phrases"] == 2
+    assert green_acres["top_positive_phrases"] == "quiet streets (2)"
+    assert summary.loc["102", "top_negative_phrases"] == ""
+
+
+def test_csv_and_parquet_inputs_give_the_same_summary(tmp_path):
+    summaries = []
+    for extension in ["csv", "parquet"]:
+        reviews_path = str(tmp_path / f"processed_reviews.{extension}")
+        phrases_path = str(tmp_path / f"phrases.{extension}")
+        write_table(processed_reviews(), reviews_path, "processed_reviews")
+        write_table(phrases(), phrases_path, "phrases")
+        summaries.append(build_summary(reviews_path, phrases_path))
+    pd.testing.assert_frame_equal(*summaries)
+
+
+def test_load_summary_restores_empty_phrase_lists(tmp_path, summary):
+    path = write_summary(summary, str(tmp_path / "project_summary.csv"))
+    loaded = load_summary(path)
+    assert loaded.index.tolist() == ["101", "102"]
+    assert loaded.loc["102", "top_negative_phrases"] == ""
+    assert loaded.loc["101", "reviews"] == 3
@@ -0,0 +1,65 @@
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from cost_tracker import BudgetExceeded, CostTracker
+
+PRICES = {"test-model": (1.0, 2.0)}
+
+
+def test_costs_are_aggregated_per_stage_and_xid():
+    costs = CostTracker(None, run_id="run", prices=PRICES)
+    costs.set_context("sentiment", 101)
+    assert costs.record("test-model", 1_000_000, 500_000) == pytest.approx(2.0)
+    costs.set_context("phrases", 101)
+    costs.record("test-model", 1_000_000, 0, cached_tokens=1_000_000)
+    ledger = costs.ledger
+    assert ledger["total"]["calls"] == 2
+    assert ledger["total"]["cost_usd"] == pytest.approx(2.25)
+    assert ledger["stages"]["phrases"]["cost_usd"] == pytest.approx(0.25)
+    assert ledger["xids"]["101"]["calls"] == 2
+
+
+def test_budget_is_checked_before_calls():
+    costs = CostTracker(None, run_id="run", prices=PRICES, budget_usd=1.0, soft_ratio=0.5)
+    costs.check()
+    costs.record("test-model", 600_000, 0)
+    assert costs.degraded
+    costs.record("test-model", 600_000, 0)
+    with pytest.raises(BudgetExceeded):
+        costs.check()
+
+
+def test_runs_are_kept_apart(tmp_path):
+    path = str(tmp_path / "costs.db")
+    CostTracker(path, run_id="monday", prices=PRICES).record("test-model", 1_000_000, 0)
+    assert CostTracker(path, run_id="tuesday", prices=PRICES).spent_usd == 0.0
+    assert CostTracker(path, run_id="monday", prices=PRICES).spent_usd == pytest.approx(1.0)
+
+
+def test_concurrent_processes_add_up(tmp_path):
+    path = str(tmp_path / "costs.db")
+    script = textwrap.dedent(f"""
+        import sys
+        sys.path[:0] = {sys.path!r}
+        from cost_tracker import CostTracker
+        costs = CostTracker({path!r}, run_id="run", prices={PRICES!r})
+        for _ in range(100):
+            costs.record("test-model", 10_000, 0)
+    """)
+    workers = [subprocess.Popen([sys.executable, "-c", script]) for _ in range(3)]
+    assert all(worker.wait() == 0 for worker in workers)
+    ledger = CostTracker(path, run_id="run").ledger
+    assert ledger["total"]["calls"] == 300
+    assert ledger["total"]["cost_usd"] == pytest.approx(3.0)
+
+
+def test_ledger_file_is_created_on_first_use(tmp_path):
+    path = tmp_path / "costs.db"
+    costs = CostTracker(str(path), run_id="run")
+    assert not path.exists()
+    costs.check()
+    assert costs.spent_usd == 0.0
+    assert path.exists()
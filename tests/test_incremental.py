@@ -0,0 +1,87 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from incremental import drop_xids, load_manifest, review_hash, save_manifest
+from llm_router import ROUTER, BackendError, MockBackend
+from phrases_extraction import process_phrases
+from storage import read_rows
+
+REVIEWS = [
+    {"xid": "101", "How Long do you stay here": "2 years", "Project name": "Green Acres",
+     "Review": "The garden is well maintained", "Sentiment": "positive"},
+    {"xid": "101", "How Long do you stay here": "1 year", "Project name": "Green Acres",
+     "Review": "Lovely clubhouse and pool", "Sentiment": "positive"},
+    {"xid": "102", "How Long do you stay here": "3 years", "Project name": "Lake View",
+     "Review": "Water leakage in every flat", "Sentiment": "negative"},
+]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # The manifest and status file live in the working directory
+    monkeypatch.chdir(tmp_path)
+    pd.DataFrame(REVIEWS).to_csv("reviews.csv", index=False)
+    return tmp_path
+
+
+@pytest.fixture
+def mock(monkeypatch):
+    mock = MockBackend()
+    monkeypatch.setitem(ROUTER.backends, "mock", mock)
+    monkeypatch.setitem(ROUTER.routes, "phrases", ["mock"])
+    return mock
+
+
+def test_manifest_round_trip_fills_defaults(workdir):
+    manifest = load_manifest()
+    assert manifest == {"reviews": {}, "phrased": [], "pools": {}, "generated": {}, "fresh": {}}
+    manifest["reviews"]["101"] = {"abc": "positive"}
+    save_manifest(manifest)
+    assert load_manifest()["reviews"] == {"101": {"abc": "positive"}}
+
+
+def test_review_hash_ignores_surrounding_whitespace():
+    row = dict(REVIEWS[0])
+    assert review_hash(row) == review_hash(dict(row, Review="  The garden is well maintained "))
+    assert review_hash(row) != review_hash(dict(row, Review="The garden is neglected"))
+
+
+def test_drop_xids_removes_only_the_given_projects(workdir):
+    pd.DataFrame(REVIEWS).to_csv("sets.csv", index=False)
+    drop_xids("sets.csv", {"101"})
+    assert [row["xid"] for row in read_rows("sets.csv")] == ["102"]
+
+
+def test_incremental_run_skips_extracted_reviews(workdir, mock):
+    process_phrases("reviews.csv", "phrases.csv", incremental=True)
+    assert len(mock.calls) == 3
+    process_phrases("reviews.csv", "phrases.csv", incremental=True)
+    assert len(mock.calls) == 3
+    assert len(read_rows("phrases.csv")) == 3
+
+
+def test_phrases_survive_a_full_run_between_incremental_runs(workdir, mock):
+    process_phrases("reviews.csv", "phrases.csv", incremental=True)
+    process_phrases("reviews.csv", "phrases.csv")
+    # The full run rewrote phrases.csv without review hashes, so nothing can be carried
+    process_phrases("reviews.csv", "phrases.csv", incremental=True)
+    assert len(read_rows("phrases.csv")) == 3
+    assert len(mock.calls) == 9
+
+
+def test_failed_extraction_is_retried_on_the_next_run(workdir, mock):
+    def responder(task, messages):
+        if "leakage" in messages[-1]["content"]:
+            raise BackendError("400", transient=False)
+        return MockBackend.RESPONSES[task]
+
+    mock.responder = responder
+    process_phrases("reviews.csv", "phrases.csv", incremental=True)
+    assert len(load_manifest()["phrased"]) == 2
+
+    mock.responder = None
+    process_phrases("reviews.csv", "phrases.csv", incremental=True)
+    assert len(mock.calls) == 4
+    assert len(load_manifest()["phrased"]) == 3
+    assert len(read_rows("phrases.csv")) == 3
@@ -0,0 +1,70 @@
+import pytest
+
+from job_queue import DEAD, DONE, LEASED, PENDING, JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=300, max_attempts=2)
+    queue.enqueue("101", "Green Acres", 1, ["quiet streets"], "2 years")
+    queue.enqueue("101", "Green Acres", 2, ["water leakage"], "2 years")
+    yield queue
+    queue.close()
+
+
+def states(queue):
+    return {(job["xid"], job["set_number"]): job["state"] for job in queue.jobs()}
+
+
+def test_only_the_lease_holder_can_complete(queue):
+    job = queue.lease("w1")
+    assert not queue.complete(job["xid"], job["set_number"], "w2", "{}")
+    assert queue.complete(job["xid"], job["set_number"], "w1", "{}")
+    assert states(queue)[("101", 1)] == DONE
+
+
+def test_expired_lease_is_taken_over(queue):
+    queue.lease_seconds = -1
+    job = queue.lease("w1", only=[("101", 1)])
+    taken = queue.lease("w2", only=[("101", 1)])
+    assert taken["attempts"] == 2
+    # The first worker's late result and failure are both discarded
+    assert not queue.complete(job["xid"], job["set_number"], "w1", "{}")
+    assert not queue.fail(job["xid"], job["set_number"], "w1", "timeout")
+    assert not queue.release(job["xid"], job["set_number"], "w1")
+    assert queue.complete(taken["xid"], taken["set_number"], "w2", "{}")
+
+
+def test_finished_job_cannot_be_released(queue):
+    job = queue.lease("w1")
+    assert queue.complete(job["xid"], job["set_number"], "w1", "{}")
+    assert not queue.release(job["xid"], job["set_number"], "w1")
+    assert states(queue)[("101", 1)] == DONE
+
+
+def test_release_does_not_count_the_attempt(queue):
+    job = queue.lease("w1", only=[("101", 2)])
+    assert queue.release(job["xid"], job["set_number"], "w1")
+    assert states(queue)[("101", 2)] == PENDING
+    assert queue.lease("w1", only=[("101", 2)])["attempts"] == 1
+
+
+def test_failures_dead_letter_and_retry_dead_requeues(queue):
+    for _ in range(2):
+        job = queue.lease("w1", only=[("101", 2)])
+        assert queue.fail(job["xid"], job["set_number"], "w1", "bad JSON")
+    assert states(queue)[("101", 2)] == DEAD
+
+    assert queue.retry_dead() == [("101", 2)]
+    job = next(j for j in queue.jobs() if j["set_number"] == 2)
+    assert job["state"] == PENDING
+    assert job["attempts"] == 0
+    assert job["last_error"] is None
+
+
+def test_lease_only_claims_the_given_jobs(queue):
+    job = queue.lease("w1", only=[("101", 2)])
+    assert (job["xid"], job["set_number"]) == ("101", 2)
+    assert queue.lease("w1", only=[("101", 2)]) is None
+    assert queue.lease("w1", only=[]) is None
+    assert states(queue) == {("101", 1): PENDING, ("101", 2): LEASED}
@@ -0,0 +1,115 @@
+import json
+
+import pytest
+
+import progress
+from llm_router import (ROUTES, BackendError, LexiconBackend, LLMRouter, MockBackend, NoBackendAvailable,
+                        RoutedChat)
+
+MESSAGES = [{"role": "system", "content": "Classify the review."},
+            {"role": "user", "content": 'Review: "Great clean and green society"'}]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(progress, "sleep", lambda seconds, kind: sleeps.append((seconds, kind)))
+    return sleeps
+
+
+def backend(name, responder):
+    mock = MockBackend(responder)
+    mock.name = name
+    return mock
+
+
+def failing(error):
+    def responder(task, messages):
+        raise error
+    return responder
+
+
+def test_transient_errors_are_retried_with_backoff(sleeps):
+    answers = iter([BackendError("503"), BackendError("429"), "positive"])
+
+    def flaky(task, messages):
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    router = LLMRouter([backend("primary", flaky)], routes={"sentiment": ["primary"]}, retries=2,
+                       backoff_seconds=1.0)
+    assert router.complete_with_backend("sentiment", MESSAGES) == ("positive", "primary")
+    assert sleeps == [(1.0, "backoff"), (2.0, "backoff")]
+    assert router.breakers["primary"].failures == 0
+
+
+def test_non_transient_error_falls_back_without_retrying(sleeps):
+    primary = backend("primary", failing(BackendError("400", transient=False)))
+    router = LLMRouter([primary, backend("secondary", lambda task, messages: "negative")],
+                       routes={"sentiment": ["primary", "secondary"]})
+    assert router.complete_with_backend("sentiment", MESSAGES) == ("negative", "secondary")
+    assert len(primary.calls) == 1
+    assert sleeps == []
+    assert router.stats["primary"]["failed"] == 1
+
+
+def test_circuit_opens_after_repeated_failures(sleeps):
+    primary = backend("primary", failing(ConnectionError("unreachable")))
+    router = LLMRouter([primary, backend("secondary", lambda task, messages: "positive")],
+                       routes={"sentiment": ["primary", "secondary"]}, failure_threshold=2, retries=0)
+    for _ in range(3):
+        router.complete("sentiment", MESSAGES)
+    assert router.is_open("primary")
+    assert len(primary.calls) == 2
+
+
+def test_deferred_answers_go_to_the_next_backend(sleeps):
+    router = LLMRouter([backend("unsure", lambda task, messages: None),
+                        backend("sure", lambda task, messages: "positive")],
+                       routes={"sentiment": ["unsure", "sure"]})
+    assert router.complete("sentiment", MESSAGES) == "positive"
+    assert router.stats["unsure"]["deferred"] == 1
+
+
+def test_no_backend_available_when_every_backend_fails(sleeps):
+    router = LLMRouter([backend("primary", failing(BackendError("500")))],
+                       routes={"sentiment": ["primary", "missing"]}, retries=1)
+    with pytest.raises(NoBackendAvailable, match="missing: unknown backend"):
+        router.complete("sentiment", MESSAGES)
+
+
+def test_sentiment_falls_back_to_gemini_by_default():
+    assert ROUTES["sentiment"][-1] == "gemini"
+
+
+def test_wildcard_route_replaces_the_defaults(sleeps):
+    router = LLMRouter([MockBackend(), LexiconBackend()], routes={"*": ["mock"], "sentiment": ["lexicon"]})
+    assert [router.route(task) for task in ("fused", "phrases", "generation")] == [["mock"]] * 3
+    assert router.route("sentiment") == ["lexicon"]
+    assert LLMRouter([MockBackend()], routes={"phrases": ["mock"]}).route("fused") == ROUTES["fused"]
+
+
+def test_lexicon_is_an_opt_in_stopgap(sleeps):
+    assert "lexicon" not in ROUTES["sentiment"]
+    router = LLMRouter([backend("primary", failing(BackendError("503"))), LexiconBackend()],
+                       routes={"sentiment": ["primary", "lexicon"]}, retries=0)
+    text, name = router.complete_with_backend("sentiment", MESSAGES)
+    assert (text, name) == ("positive", "lexicon")
+    assert router.is_stopgap(name)
+    assert not router.is_stopgap("primary")
+
+
+def test_routed_chat_sends_the_schema_and_history(sleeps):
+    mock = MockBackend()
+    router = LLMRouter([mock], routes={"generation": ["mock"]})
+    schema = {"type": "object", "properties": {"overall": {"type": "string"}}}
+    chat = RoutedChat(router, "generation", "Write as a resident.", response_schema=schema)
+    response = chat.send_message("Set 1 phrases")
+    assert json.loads(response.text)["overall"] == "4"
+
+    task, messages = mock.calls[0]
+    assert messages[0]["role"] == "system"
+    assert json.dumps(schema) in messages[0]["content"]
+    assert [m["role"] for m in chat.get_history()] == ["user", "assistant"]
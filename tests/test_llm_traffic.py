@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+import llm_traffic
+from llm_router import AnalyzeBackend, LLMRouter
+from llm_traffic import TRAFFIC, ReplayMiss, ReplayedError, TrafficLog
+
+MESSAGES = [{"role": "system", "content": "Classify the review."},
+            {"role": "user", "content": 'Review: "Great clean and green society"'}]
+
+
+class FakeResponse:
+    def __init__(self, status_code, result):
+        self.status_code = status_code
+        self.text = json.dumps({"result": result})
+
+    def json(self):
+        return json.loads(self.text)
+
+
+@pytest.fixture
+def traffic(tmp_path, monkeypatch):
+    """Point the shared traffic log at a temporary file; returns a function switching modes."""
+    path = str(tmp_path / "traffic.jsonl")
+
+    def use(mode):
+        monkeypatch.setattr(TRAFFIC, "mode", mode)
+        monkeypatch.setattr(TRAFFIC, "path", path)
+        monkeypatch.setattr(TRAFFIC, "responses", None)
+        monkeypatch.setattr(TRAFFIC, "served", {})
+        monkeypatch.setattr(TRAFFIC, "prompts", None)
+        return path
+    return use
+
+
+def make_router():
+    backup = AnalyzeBackend(key_type="LARGE")
+    backup.name = "backup"
+    return LLMRouter([AnalyzeBackend(), backup], routes={"sentiment": ["analyze", "backup"]},
+                     retries=1, backoff_seconds=0)
+
+
+def fake_post(url, json, headers, timeout):
+    if json["keyType"] == "MINI":
+        raise requests.exceptions.ConnectionError("analyze is down")
+    return FakeResponse(200, "positive")
+
+
+def test_log_stores_long_prompts_once(tmp_path):
+    log = TrafficLog("record", str(tmp_path / "traffic.jsonl"))
+    prompt = "persona " * 50
+    log.record("gemini_chat", {"chat": prompt, "messages": ["a"]}, {"text": "1"})
+    log.record("gemini_chat", {"chat": prompt, "messages": ["a", "b"]}, {"text": "2"})
+    lines = [json.loads(line) for line in open(log.path, encoding="utf-8")]
+    assert [("prompt" in line) for line in lines] == [True, False, False]
+    assert lines[1]["request"]["chat"] == {"$prompt": lines[0]["prompt"]}
+
+    replay = TrafficLog("replay", log.path)
+    assert replay.replay("gemini_chat", {"chat": prompt, "messages": ["a", "b"]}) == {"text": "2"}
+
+
+def test_missing_replay_log_is_a_replay_miss(tmp_path):
+    log = TrafficLog("replay", str(tmp_path / "missing.jsonl"))
+    with pytest.raises(ReplayMiss):
+        log.replay("analyze", {})
+
+
+def test_fallback_run_replays_the_same_way(traffic, monkeypatch):
+    traffic("record")
+    monkeypatch.setattr(requests, "post", fake_post)
+    assert make_router().complete_with_backend("sentiment", MESSAGES) == ("positive", "backup")
+
+    traffic("replay")
+    monkeypatch.setattr(requests, "post", lambda *args, **kwargs: pytest.fail("replay used the network"))
+    router = make_router()
+    assert router.complete_with_backend("sentiment", MESSAGES) == ("positive", "backup")
+    assert router.stats["analyze"]["failed"] == 1
+
+
+def test_recorded_failures_raise_on_replay(traffic, monkeypatch):
+    traffic("record")
+    monkeypatch.setattr(requests, "post", fake_post)
+    payload = {"messages": MESSAGES, "temperature": 0.8, "keyType": "MINI"}
+    with pytest.raises(requests.exceptions.ConnectionError):
+        llm_traffic.post_analyze(payload)
+
+    traffic("replay")
+    with pytest.raises(ReplayedError, match="ConnectionError: analyze is down"):
+        llm_traffic.post_analyze(payload)
+
+
+def test_backend_without_recording_is_passed_over(traffic, monkeypatch):
+    path = traffic("record")
+    monkeypatch.setattr(requests, "post", fake_post)
+    make_router().complete("sentiment", MESSAGES)
+    # Drop the recorded failures, as if the first backend had been skipped when recording
+    lines = [line for line in open(path, encoding="utf-8") if '"error"' not in line]
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+
+    traffic("replay")
+    assert make_router().complete_with_backend("sentiment", MESSAGES) == ("positive", "backup")
+
+
+def test_unrecorded_request_raises_replay_miss(traffic, monkeypatch):
+    path = traffic("replay")
+    open(path, "w").close()
+    with pytest.raises(ReplayMiss, match="No recorded response could serve 'sentiment'"):
+        make_router().complete("sentiment", MESSAGES)
@@ -0,0 +1,86 @@
+import random
+from collections import defaultdict
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from phrase_store import NEGATIVE, OTHER, POSITIVE, PhraseStore
+
+LABELS = {'positive': POSITIVE, 'negative': NEGATIVE, 'neutral': OTHER}
+
+
+def random_rows(count=500, seed=7):
+    rng = random.Random(seed)
+    phrases = [f"phrase {i}" for i in range(60)]
+    projects = [("101", "Green Acres"), ("102", "Lake View"), ("103", "Hill Crest")]
+    return [(rng.choice(projects), rng.choice(phrases), rng.choice(list(LABELS)), rng.randint(0, 9))
+            for _ in range(count)]
+
+
+def dict_pools(rows):
+    """The grouping set_making did before the phrase store, as the reference."""
+    data = defaultdict(lambda: {'positives': [], 'negatives': [], 'durations': {}})
+    for key, phrase, sentiment, duration in rows:
+        if sentiment == 'positive':
+            data[key]['positives'].append(phrase)
+        elif sentiment == 'negative':
+            data[key]['negatives'].append(phrase)
+        data[key]['durations'][phrase] = duration
+    return data
+
+
+def old_format_set(positives, negatives, durations):
+    formatted = [f"{p} (positive)" for p in positives] + [f"{n} (negative)" for n in negatives]
+    durations_list = [durations.get(p, 0) for p in positives + negatives]
+    avg_duration = sum(durations_list) / len(durations_list) if durations_list else 0
+    return '; '.join(formatted), f"{avg_duration:.1f} Years"
+
+
+@pytest.fixture
+def rows():
+    return random_rows()
+
+
+@pytest.fixture
+def store(rows):
+    store = PhraseStore()
+    for key, phrase, sentiment, duration in rows:
+        store.add(key, phrase, LABELS[sentiment], duration)
+    store.finalize()
+    return store
+
+
+def test_pools_match_the_dict_grouping(rows, store):
+    reference = dict_pools(rows)
+    assert store.projects == list(reference)
+    for index, key in enumerate(store.projects):
+        pool = store.pool(index)
+        assert pool.texts(pool.positives) == reference[key]['positives']
+        assert pool.texts(pool.negatives) == reference[key]['negatives']
+        assert pool.durations() == reference[key]['durations']
+
+
+def test_formatted_sets_match_the_old_output(rows, store):
+    reference = dict_pools(rows)
+    for index, key in enumerate(store.projects):
+        pool = store.pool(index)
+        expected = reference[key]
+        assert pool.format_set(pool.positives, pool.negatives) == old_format_set(
+            expected['positives'], expected['negatives'], expected['durations'])
+        # A subset, as a distributed set is
+        assert pool.format_set(pool.positives[:5], pool.negatives[3:4]) == old_format_set(
+            expected['positives'][:5], expected['negatives'][3:4], expected['durations'])
+
+
+def test_phrase_texts_are_stored_once(rows, store):
+    assert len(store.texts) == len({phrase for _, phrase, _, _ in rows})
+    assert len(store) == 3
+
+
+def test_empty_set_formats_like_before():
+    store = PhraseStore()
+    store.add(("101", "Green Acres"), "quiet streets", OTHER, 2)
+    store.finalize()
+    pool = store.pool(0)
+    assert pool.format_set(pool.positives, pool.negatives) == ('', '0.0 Years')
@@ -0,0 +1,30 @@
+import pytest
+
+import rate_limit
+from rate_limit import DailyLimitReached, RateLimiter
+
+
+def test_processes_sharing_the_file_share_the_quota(tmp_path):
+    path = str(tmp_path / "limit.db")
+    first, second = RateLimiter(100, 3, path=path), RateLimiter(100, 3, path=path)
+    first.acquire()
+    second.acquire()
+    first.acquire()
+    assert first.daily_count == second.daily_count == 3
+    with pytest.raises(DailyLimitReached):
+        second.acquire()
+
+
+def test_requests_over_the_minute_limit_wait(monkeypatch):
+    waits = []
+    limiter = RateLimiter(2, 100)
+
+    def sleep(seconds, kind):
+        waits.append(kind)
+        # Age every logged request by a minute, as if the wait had passed
+        limiter.conn.execute("UPDATE rate_limit_requests SET ts = ts - 61")
+
+    monkeypatch.setattr(rate_limit.progress, "sleep", sleep)
+    for _ in range(3):
+        limiter.acquire()
+    assert waits == ["rate_limit"]
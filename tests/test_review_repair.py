@@ -0,0 +1,53 @@
+import pytest
+
+from review_repair import coerce_rating, extract_json_text, load_json_object, normalize_review
+
+
+def test_extract_json_text_drops_fences_and_trailing_prose():
+    text = '```json\n{"overall": "4", "note": "a } in a string"}\n```'
+    assert extract_json_text(text) == '{"overall": "4", "note": "a } in a string"}'
+    assert extract_json_text('Sure! {"overall": "4"} Hope this helps {smile}') == '{"overall": "4"}'
+
+
+def test_load_json_object_repairs_truncation():
+    data = load_json_object('{"positive_review": "Lovely park", "negative_review": "Traffic is hea')
+    assert data == {"positive_review": "Lovely park"}
+    data = load_json_object('{"positive_review": "Lovely park", "amenities":')
+    assert data == {"positive_review": "Lovely park"}
+
+
+@pytest.mark.parametrize("text", ["", "no json here", "[1, 2]"])
+def test_load_json_object_rejects_non_objects(text):
+    with pytest.raises(ValueError):
+        load_json_object(text)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (4, "4"),
+    (4.0, "4"),
+    ("4", "4"),
+    ("4/5", "4"),
+    ("4.5 out of 5", "4.5"),
+    ("8/10", "4"),
+    ("7 out of 10", "3.5"),
+    ("N/A", "NA"),
+    (None, "NA"),
+    ("excellent", None),
+    (0, None),
+    ("9", None),
+    (True, None),
+])
+def test_coerce_rating(value, expected):
+    assert coerce_rating(value) == expected
+
+
+def test_normalize_review_reports_failed_fields():
+    review, failed = normalize_review({
+        "positive_review": "Quiet and green", "negative_review": "",
+        "society_management": "4/5", "green_area": 5, "amenities": "great",
+        "connectivity": "NA", "construction": "8/10",
+    }, default_duration="3 years")
+    assert failed == ["amenities"]
+    assert review["amenities"] == "NA"
+    assert review["overall"] == "4"
+    assert review["duration_of_stay"] == "3 years"
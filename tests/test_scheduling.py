@@ -0,0 +1,36 @@
+import pytest
+
+from scheduling import HALF_LIFE_DAYS, mark_fresh, prioritize, priority_scores, review_counts
+
+NOW = 1_700_000_000.0
+DAY = 86400
+
+
+def test_review_counts_per_xid():
+    rows = [{"xid": "101"}, {"XID": "101"}, {"xid": 102}]
+    assert review_counts(rows) == {"101": 2, "102": 1}
+
+
+def test_missing_output_outranks_volume():
+    counts = {"101": 100, "102": 1}
+    scores = priority_scores(counts, counts, has_output={"101"}, now=NOW)
+    assert scores["102"] > scores["101"]
+
+
+def test_fresh_reviews_decay_with_the_half_life():
+    counts = {"101": 10, "102": 10}
+    fresh = {"101": NOW, "102": NOW - HALF_LIFE_DAYS * DAY}
+    scores = priority_scores(counts, counts, fresh=fresh, has_output=counts, now=NOW)
+    assert scores["101"] - scores["102"] == pytest.approx(0.5)
+
+
+def test_prioritize_is_stable_for_ties():
+    items = [{"xid": "a"}, {"xid": "b"}, {"xid": "c"}]
+    ordered = prioritize(items, {"b": 2.0, "a": 1.0, "c": 1.0})
+    assert [item["xid"] for item in ordered] == ["b", "a", "c"]
+
+
+def test_mark_fresh_records_the_time():
+    manifest = {"fresh": {}}
+    mark_fresh(manifest, [101, "102"], now=NOW)
+    assert manifest["fresh"] == {"101": NOW, "102": NOW}
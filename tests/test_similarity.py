@@ -0,0 +1,40 @@
+from similarity import SimilarityIndex
+
+REVIEW = ("The society is well maintained with a large green park, a clean pool and friendly guards "
+          "at the gate, though parking gets crowded on weekends.")
+REWORDED = ("The society is well maintained with a large green park, a clean pool and friendly guards "
+            "at the gate, though visitor parking gets crowded on weekends.")
+DIFFERENT = "Frequent power cuts and water leakage in the basement make living here difficult every monsoon."
+
+
+def test_near_duplicates_of_other_sets_are_flagged():
+    index = SimilarityIndex(threshold=0.5)
+    index.add("101", 1, REVIEW)
+    duplicate, similarity = index.is_duplicate("101", 2, REWORDED)
+    assert duplicate and similarity >= 0.5
+    assert not index.is_duplicate("101", 2, DIFFERENT)[0]
+    assert index.stats["checked"] == 2
+
+
+def test_projects_and_the_same_set_are_not_compared():
+    index = SimilarityIndex()
+    index.add("101", 1, REVIEW)
+    # A regenerated review of set 1 is compared with the other sets only
+    assert index.max_similarity("101", 1, REVIEW) == 0.0
+    assert index.max_similarity("102", 2, REVIEW) == 0.0
+
+
+def test_index_file_is_shared_and_forget_clears_a_project(tmp_path):
+    path = str(tmp_path / "signatures.db")
+    SimilarityIndex(path=path).add("101", 1, REVIEW)
+    other_worker = SimilarityIndex(path=path)
+    assert other_worker.max_similarity("101", 2, REVIEW) == 1.0
+    other_worker.forget("101")
+    assert SimilarityIndex(path=path).max_similarity("101", 2, REVIEW) == 0.0
+
+
+def test_empty_reviews_are_never_duplicates():
+    index = SimilarityIndex()
+    index.add("101", 1, "")
+    assert index.max_similarity("101", 2, "") == 0.0
+    assert index.rejection_rate() == 0.0
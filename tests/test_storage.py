@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+
+from incremental import sets_hash
+from storage import append_table, phrase_list, phrase_text, read_table, write_table
+
+
+def test_phrase_list_accepts_strings_lists_and_missing_cells():
+    assert phrase_list("quiet streets; water leakage;") == ["quiet streets", "water leakage"]
+    assert phrase_list("quiet streets\nwater leakage") == ["quiet streets", "water leakage"]
+    assert phrase_list(["quiet streets", " ", "water leakage"]) == ["quiet streets", "water leakage"]
+    assert phrase_list(None) == []
+    assert phrase_list(float("nan")) == []
+    assert phrase_text(["quiet streets", "water leakage"]) == "quiet streets; water leakage"
+
+
+def test_output_sets_round_trip_as_phrase_lists(tmp_path):
+    path = str(tmp_path / "output_sets.parquet")
+    sets = pd.DataFrame({
+        "xid": [101, 102], "Project name": ["Green Acres", "Lake View"],
+        "Set 1": ["quiet streets; water leakage", ""],
+    })
+    write_table(sets, path, "output_sets")
+    loaded = read_table(path)
+    assert loaded["xid"].tolist() == ["101", "102"]
+    assert list(loaded.at[0, "Set 1"]) == ["quiet streets", "water leakage"]
+    assert phrase_list(loaded.at[1, "Set 1"]) == []
+    # Sets hash the same whether read back from CSV or Parquet
+    row = loaded.iloc[0].to_dict()
+    assert sets_hash(row, ["Set 1"]) == sets_hash(sets.iloc[0].to_dict(), ["Set 1"])
+
+
+def test_appended_parts_with_empty_review_columns_read_back_together(tmp_path):
+    path = str(tmp_path / "structured_reviews.parquet")
+    review = json.dumps({"positive_review": "Lovely park", "overall": "4"})
+    append_table(pd.DataFrame({"xid": ["101"], "Project name": ["Green Acres"], "Review 1": [""]}),
+                 path, "structured_reviews")
+    append_table(pd.DataFrame({"xid": ["102"], "Project name": ["Lake View"], "Review 1": [review]}),
+                 path, "structured_reviews")
+    loaded = read_table(path).sort_values("xid").reset_index(drop=True)
+    assert loaded.at[0, "Review 1"] is None
+    assert loaded.at[1, "Review 1"]["positive_review"] == "Lovely park"
+    assert loaded.at[1, "Review 1"]["negative_review"] is None
+
+
+def test_processed_reviews_keep_half_point_ratings(tmp_path):
+    reviews = pd.DataFrame({
+        "xid": ["101", "101", "102"], "project_name": ["Green Acres", "Green Acres", "Lake View"],
+        "green_area": ["4.5", "3.5", "NA"], "overall_rating": ["4", "2.5", "5"],
+    })
+    csv_path, parquet_path = str(tmp_path / "processed_reviews.csv"), str(tmp_path / "processed_reviews.parquet")
+    write_table(reviews, csv_path, "processed_reviews")
+    write_table(reviews, parquet_path, "processed_reviews")
+
+    from_csv = pd.to_numeric(read_table(csv_path)["green_area"], errors="coerce")
+    from_parquet = read_table(parquet_path)["green_area"]
+    assert from_parquet.tolist()[:2] == [4.5, 3.5]
+    assert pd.isna(from_parquet.iloc[2])
+    assert from_parquet.astype(float).equals(from_csv.astype(float))
+    assert read_table(parquet_path)["overall_rating"].tolist() == [4.0, 2.5, 5.0]